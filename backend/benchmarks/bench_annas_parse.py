@@ -0,0 +1,62 @@
+"""Parse-time benchmark for Anna's Archive search pages.
+
+Runs every available parser backend over the saved pages in
+fixtures/annas_*.html and reports time per page.
+
+    python benchmarks/bench_annas_parse.py [--rounds 20] [--limit 20]
+"""
+import argparse
+import glob
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from providers import annasarchive  # noqa: E402
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def available_parsers():
+    parsers = ["bs4"]
+    if annasarchive.lxml is not None:
+        parsers.append("lxml")
+    return parsers
+
+
+def bench(html: str, parser: str, rounds: int, limit: int):
+    timings = []
+    count = 0
+    for _ in range(rounds):
+        started = time.perf_counter()
+        count = len(annasarchive.parse_results(html, limit, parser=parser))
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings, count
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    pages = sorted(glob.glob(os.path.join(FIXTURES_DIR, "annas_*.html")))
+    if not pages:
+        sys.exit(f"No fixtures found in {FIXTURES_DIR}")
+
+    print(f"{'page':<28} {'parser':<6} {'books':>5} {'median ms':>10} {'min ms':>8} {'max ms':>8}")
+    for path in pages:
+        with open(path, "r", encoding="utf-8") as f:
+            html = f.read()
+        for name in available_parsers():
+            timings, count = bench(html, name, args.rounds, args.limit)
+            print(
+                f"{os.path.basename(path):<28} {name:<6} {count:>5} "
+                f"{statistics.median(timings):>10.1f} {min(timings):>8.1f} {max(timings):>8.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+"""End-to-end API benchmark against local upstream stand-ins.
+
+Starts the stand-in upstreams (standin.py) and the API in a subprocess on
+a scratch database, drives /api/search, /api/categoria/{nome} and
+/api/books/{id} at a fixed concurrency and reports throughput, latency
+percentiles and per-stage timings taken from the API's /metrics.
+
+    python benchmarks/bench_api.py
+    python benchmarks/bench_api.py --requests 500 --concurrency 32 --latency annasarchive=400,gutenberg=60
+    python benchmarks/bench_api.py --errors 0.1 --scenarios search-cold,search-warm
+    python benchmarks/bench_api.py --cache redis   # shared cache on the Redis stand-in
+"""
+import argparse
+import asyncio
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List, Tuple
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from redis_standin import RedisStandin  # noqa: E402
+from standin import StandinServer, add_config_arguments, config_from_args, free_port  # noqa: E402
+
+SCENARIOS = ["search-cold", "search-warm", "category", "book"]
+CATEGORIES = ["Fantasia", "Dark", "Estudo"]
+
+# Histograms reported as per-stage timings: metric -> label to break down by
+STAGES = {
+    "http_request_duration_seconds": "route",
+    "provider_call_duration_seconds": "provider",
+    "upstream_wait_duration_seconds": "lane",
+    "db_upsert_duration_seconds": None,
+    "write_behind_batch_duration_seconds": None,
+}
+
+SAMPLE_RE = re.compile(r'^(\w+?)(?:\{(.*)\})? (\S+)$')
+LABEL_RE = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+Metrics = Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float]
+
+
+def parse_metrics(text: str) -> Metrics:
+    samples: Metrics = {}
+    for line in text.splitlines():
+        match = SAMPLE_RE.match(line)
+        if not match:
+            continue
+        name, labels, value = match.groups()
+        samples[(name, tuple(sorted(LABEL_RE.findall(labels or ""))))] = float(value)
+    return samples
+
+
+def stage_timings(before: Metrics, after: Metrics) -> List[Tuple[str, int, float]]:
+    """(stage, calls, mean ms) for each histogram series that moved"""
+    rows = []
+    for (name, labels), total in after.items():
+        if not name.endswith("_sum") or name[:-4] not in STAGES:
+            continue
+        base = name[:-4]
+        count = after.get((base + "_count", labels), 0) - before.get((base + "_count", labels), 0)
+        if count <= 0:
+            continue
+        elapsed = total - before.get((name, labels), 0.0)
+        by = STAGES[base]
+        label = dict(labels).get(by, "") if by else ""
+        if label == "/metrics":
+            continue  # the benchmark's own scrapes
+        stage = base.replace("_duration_seconds", "") + (f"[{label}]" if label else "")
+        rows.append((stage, int(count), elapsed / count * 1000))
+    return sorted(rows)
+
+
+def counter_deltas(before: Metrics, after: Metrics, name: str, by: str) -> Dict[str, int]:
+    deltas: Dict[str, int] = defaultdict(int)
+    for (sample, labels), value in after.items():
+        if sample == name:
+            delta = value - before.get((sample, labels), 0.0)
+            if delta:
+                deltas[dict(labels).get(by, "")] += int(delta)
+    return dict(deltas)
+
+
+def percentile(ordered: List[float], q: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def drive(
+    client: httpx.AsyncClient, make_url: Callable[[int], str], requests: int, concurrency: int
+) -> Tuple[List[float], Dict[int, int], float]:
+    latencies: List[float] = []
+    statuses: Dict[int, int] = defaultdict(int)
+    next_index = 0
+
+    async def worker() -> None:
+        nonlocal next_index
+        while next_index < requests:
+            index = next_index
+            next_index += 1
+            started = time.perf_counter()
+            try:
+                response = await client.get(make_url(index))
+                statuses[response.status_code] += 1
+            except httpx.HTTPError:
+                statuses[0] += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return sorted(latencies), dict(statuses), time.perf_counter() - started
+
+
+async def book_ids(client: httpx.AsyncClient) -> List[str]:
+    response = await client.get("/api/search", params={"query": "bench books"})
+    ids = [book["id"] for book in response.json()]
+    # Books reach books_cache through the write-behind queue
+    await asyncio.sleep(0.5)
+    return ids or ["missing"]
+
+
+async def run_benchmarks(base_url: str, standin: StandinServer, args: argparse.Namespace) -> None:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60.0) as client:
+        await client.get("/api/categorias")  # seeds the default categories
+        ids = await book_ids(client) if "book" in args.scenarios else []
+
+        # search-warm and category first pay one cold fan-out per distinct key
+        urls: Dict[str, Callable[[int], str]] = {
+            "search-cold": lambda i: f"/api/search?query=bench+cold+{i}",
+            "search-warm": lambda i: f"/api/search?query=bench+warm+{i % 5}",
+            "category": lambda i: f"/api/categoria/{CATEGORIES[i % len(CATEGORIES)]}",
+            "book": lambda i: f"/api/books/{ids[i % len(ids)]}",
+        }
+
+        print(f"{'scenario':<12} {'reqs':>5} {'errors':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+        details = []
+        for scenario in args.scenarios:
+            before = parse_metrics((await client.get("/metrics")).text)
+            upstream_before = standin.request_counts()
+
+            latencies, statuses, elapsed = await drive(client, urls[scenario], args.requests, args.concurrency)
+
+            after = parse_metrics((await client.get("/metrics")).text)
+            upstream = {
+                name: count - upstream_before.get(name, 0)
+                for name, count in standin.request_counts().items()
+                if count - upstream_before.get(name, 0)
+            }
+            errors = sum(count for status, count in statuses.items() if status >= 400 or status == 0)
+            print(
+                f"{scenario:<12} {len(latencies):>5} {errors:>6} {len(latencies) / elapsed:>8.1f} "
+                f"{percentile(latencies, 0.50) * 1000:>8.1f} {percentile(latencies, 0.95) * 1000:>8.1f} "
+                f"{percentile(latencies, 0.99) * 1000:>8.1f}"
+            )
+            details.append((scenario, before, after, upstream))
+
+        for scenario, before, after, upstream in details:
+            print(f"\n{scenario}")
+            print(f"  upstream requests: {upstream or '-'}")
+            print(f"  cache lookups:     {counter_deltas(before, after, 'search_cache_requests_total', 'result') or '-'}")
+            print(f"  provider outcomes: {counter_deltas(before, after, 'provider_calls_total', 'status') or '-'}")
+            for stage, calls, mean_ms in stage_timings(before, after):
+                print(f"  {stage:<48} {calls:>6} calls {mean_ms:>9.2f} ms avg")
+
+
+def start_api(port: int, workdir: str, env: Dict[str, str]) -> subprocess.Popen:
+    api_env = dict(os.environ)
+    # Every stand-in shares one host; don't let its rate limit cap the benchmark
+    api_env.setdefault("UPSTREAM_HOST_RATES", "127.0.0.1=10000/10000")
+    api_env.update(env)
+    api_env.update({
+        "PYTHONPATH": BACKEND_DIR,
+        "BOT_MODE": "off",
+        "COVER_CACHE_DIR": os.path.join(workdir, "cover_cache"),
+    })
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=workdir,  # books.db is opened relative to the working directory
+        env=api_env,
+    )
+
+
+def wait_until_up(base_url: str, process: subprocess.Popen, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            sys.exit("API exited during startup")
+        try:
+            httpx.get(base_url + "/", timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    sys.exit("API did not start in time")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument(
+        "--scenarios",
+        type=lambda value: value.split(","),
+        default=SCENARIOS,
+        help=f"comma-separated subset of {','.join(SCENARIOS)}",
+    )
+    parser.add_argument(
+        "--cache", choices=["none", "sqlite", "redis"], default="none", help="shared cache backend (CACHE_URL)"
+    )
+    add_config_arguments(parser)
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    standin = StandinServer(config_from_args(args))
+    standin.start()
+    workdir = tempfile.mkdtemp(prefix="bench_api_")
+    env = standin.env()
+    redis = None
+    if args.cache == "redis":
+        redis = RedisStandin()
+        redis.start()
+        env["CACHE_URL"] = redis.url()
+    elif args.cache == "sqlite":
+        env["CACHE_URL"] = "sqlite:///" + os.path.join(workdir, "shared_cache.db")
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    api = start_api(port, workdir, env)
+    try:
+        wait_until_up(base_url, api)
+        asyncio.run(run_benchmarks(base_url, standin, args))
+    finally:
+        api.terminate()
+        api.wait(timeout=10)
+        standin.stop()
+        if redis is not None:
+            redis.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""In-process stand-in for a Redis server, for trying CACHE_URL=redis://
+without installing Redis.
+
+Speaks enough RESP2 for RedisBackend: PING, AUTH, SELECT, GET, MGET, SET
+(with EX/PX), DEL, EXISTS, DBSIZE and FLUSHDB, with expiry. Optional latency,
+added once per pipeline, simulates a cache across the network.
+
+    python benchmarks/redis_standin.py --port 6390 --latency 1
+    CACHE_URL=redis://127.0.0.1:6390/0 uvicorn main:app
+"""
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cache_backends import read_reply  # noqa: E402
+
+
+def bulk(value: Optional[bytes]) -> bytes:
+    return b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+class RedisStandin:
+    def __init__(self, port: int = 0, latency: float = 0.0) -> None:
+        self.port = port
+        self.latency = latency
+        # db -> key -> (expires at or None, value)
+        self.data: Dict[int, Dict[bytes, Tuple[Optional[float], bytes]]] = {}
+        self.commands = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def _get(self, db: int, key: bytes) -> Optional[bytes]:
+        item = self.data.get(db, {}).get(key)
+        if item is None:
+            return None
+        expires, value = item
+        if expires is not None and expires <= time.monotonic():
+            del self.data[db][key]
+            return None
+        return value
+
+    def execute(self, db: int, command: List[bytes]) -> Tuple[bytes, int]:
+        """(encoded reply, selected db after the command)"""
+        self.commands += 1
+        name, args = command[0].upper(), command[1:]
+        store = self.data.setdefault(db, {})
+        if name == b"PING":
+            return b"+PONG\r\n", db
+        if name == b"AUTH":
+            return b"+OK\r\n", db
+        if name == b"SELECT":
+            return b"+OK\r\n", int(args[0])
+        if name == b"GET":
+            return bulk(self._get(db, args[0])), db
+        if name == b"MGET":
+            return b"*%d\r\n" % len(args) + b"".join(bulk(self._get(db, key)) for key in args), db
+        if name == b"SET":
+            expires = None
+            options = [arg.upper() for arg in args[2:]]
+            if b"EX" in options:
+                expires = time.monotonic() + float(args[2 + options.index(b"EX") + 1])
+            if b"PX" in options:
+                expires = time.monotonic() + float(args[2 + options.index(b"PX") + 1]) / 1000
+            store[args[0]] = (expires, args[1])
+            return b"+OK\r\n", db
+        if name == b"DEL":
+            removed = sum(1 for key in args if store.pop(key, None) is not None)
+            return b":%d\r\n" % removed, db
+        if name == b"EXISTS":
+            return b":%d\r\n" % sum(1 for key in args if self._get(db, key) is not None), db
+        if name == b"DBSIZE":
+            return b":%d\r\n" % len(store), db
+        if name == b"FLUSHDB":
+            store.clear()
+            return b"+OK\r\n", db
+        return b"-ERR unknown command '%s'\r\n" % name, db
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        db = 0
+        try:
+            while True:
+                command = await read_reply(reader)
+                if not isinstance(command, list) or not command:
+                    writer.write(b"-ERR protocol error\r\n")
+                    break
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                reply, db = self.execute(db, command)
+                writer.write(reply)
+                # Answer the rest of a pipeline without adding latency per
+                # command (StreamReader has no public way to peek)
+                while reader._buffer:  # type: ignore[attr-defined]
+                    command = await read_reply(reader)
+                    reply, db = self.execute(db, command)
+                    writer.write(reply)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self) -> None:
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        async with self._server:
+            await self._server.serve_forever()
+
+    def start(self) -> None:
+        """Serve from a background thread with its own event loop"""
+        started = threading.Event()
+
+        def run() -> None:
+            self._loop = asyncio.new_event_loop()
+            self._loop.call_soon(started.set)
+            try:
+                self._loop.run_until_complete(self.serve())
+            except asyncio.CancelledError:
+                pass
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        started.wait()
+        while self._server is None:
+            time.sleep(0.01)
+
+    def stop(self) -> None:
+        if self._loop is not None and self._server is not None:
+            self._loop.call_soon_threadsafe(self._server.close)
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def url(self, db: int = 0) -> str:
+        return f"redis://127.0.0.1:{self.port}/{db}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=6390)
+    parser.add_argument("--latency", type=float, default=0.0, help="ms added per pipeline")
+    args = parser.parse_args()
+
+    standin = RedisStandin(args.port, args.latency / 1000)
+    print(f"export CACHE_URL=redis://127.0.0.1:{args.port}/0")
+    try:
+        asyncio.run(standin.serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""Local stand-ins for the four upstream book APIs.
+
+Replays the saved responses in fixtures/ with configurable latency and
+error injection, so the API can be benchmarked offline. The provider base
+URLs (GUTENDEX_URL, OPENLIBRARY_URL, ARCHIVE_URL, ANNAS_ARCHIVE_URL) point
+the API at it; bench_api.py does all of this for you.
+
+    python benchmarks/standin.py --port 8100 --latency 80 --errors openlibrary=0.1
+    python benchmarks/standin.py --record machado   # refresh fixtures from the real APIs
+"""
+import argparse
+import asyncio
+import functools
+import json
+import os
+import random
+import socket
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional, Tuple
+
+import httpx
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Route
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# provider -> (base URL env var, prefix on the stand-in, search path, fixture file, media type, real base URL)
+UPSTREAMS = {
+    "gutenberg": ("GUTENDEX_URL", "/gutendex", "/books/", "gutendex_search.json", "application/json", "https://gutendex.com"),
+    "openlibrary": ("OPENLIBRARY_URL", "/openlibrary", "/search.json", "openlibrary_search.json", "application/json", "https://openlibrary.org"),
+    "internetarchive": ("ARCHIVE_URL", "/archive", "/advancedsearch.php", "internetarchive_search.json", "application/json", "https://archive.org"),
+    "annasarchive": ("ANNAS_ARCHIVE_URL", "/annas", "/search", "annas_search.html", "text/html; charset=utf-8", "https://annas-archive.li"),
+}
+
+# Where each JSON upstream keeps its docs, and the query parameter that
+# selects their fields (Gutendex has none)
+PROJECTIONS = {
+    "openlibrary": (("docs",), "fields"),
+    "internetarchive": (("response", "docs"), "fl[]"),
+}
+
+# What each upstream answers past its last page
+EMPTY_PAGES = {
+    "gutenberg": b'{"count": 0, "next": null, "previous": null, "results": []}',
+    "openlibrary": b'{"numFound": 0, "start": 0, "docs": []}',
+    "internetarchive": b'{"response": {"numFound": 0, "start": 0, "docs": []}}',
+    "annasarchive": b"<html><body><div>No files found.</div></body></html>",
+}
+
+
+class StandinConfig:
+    def __init__(
+        self,
+        latency: Optional[Dict[str, float]] = None,
+        jitter: float = 0.2,
+        error_rate: Optional[Dict[str, float]] = None,
+        max_pages: int = 3,
+    ) -> None:
+        # Seconds per provider, +/- `jitter` as a fraction
+        self.latency = latency or {}
+        self.jitter = jitter
+        # Fraction of requests answered with a 503, per provider
+        self.error_rate = error_rate or {}
+        # Pages past this one come back empty
+        self.max_pages = max_pages
+
+
+def create_app(config: StandinConfig) -> Starlette:
+    app = Starlette()
+    app.state.requests = Counter()
+    bodies = {}
+    for name, (_, _, _, fixture, _, _) in UPSTREAMS.items():
+        with open(os.path.join(FIXTURES_DIR, fixture), "rb") as f:
+            bodies[name] = f.read()
+
+    def handler(name: str, media_type: str):
+        async def endpoint(request: Request) -> Response:
+            app.state.requests[name] += 1
+            latency = config.latency.get(name, 0.0)
+            if latency:
+                await asyncio.sleep(latency * random.uniform(1 - config.jitter, 1 + config.jitter))
+            if random.random() < config.error_rate.get(name, 0.0):
+                return Response("injected error", status_code=503)
+            try:
+                page = int(request.query_params.get("page", "1"))
+            except ValueError:
+                page = 1
+            if page > config.max_pages:
+                return Response(EMPTY_PAGES[name], media_type=media_type)
+            return Response(project(name, bodies[name], request), media_type=media_type)
+
+        return endpoint
+
+    for name, (_, prefix, path, _, media_type, _) in UPSTREAMS.items():
+        app.router.routes.append(Route(prefix + path, handler(name, media_type)))
+    return app
+
+
+@functools.lru_cache(maxsize=64)
+def _projected(name: str, body: bytes, fields: Tuple[str, ...]) -> bytes:
+    path, _ = PROJECTIONS[name]
+    data = json.loads(body)
+    container = data
+    for part in path[:-1]:
+        container = container[part]
+    container[path[-1]] = [
+        {field: doc[field] for field in fields if field in doc} for doc in container[path[-1]]
+    ]
+    return json.dumps(data).encode()
+
+
+def project(name: str, body: bytes, request: Request) -> bytes:
+    """Trim the docs to the requested fields, like the real APIs do"""
+    if name not in PROJECTIONS:
+        return body
+    _, param = PROJECTIONS[name]
+    fields = [field for value in request.query_params.getlist(param) for field in value.split(",") if field]
+    if not fields:
+        return body
+    return _projected(name, body, tuple(fields))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class StandinServer:
+    """Runs the stand-in app on a background thread"""
+
+    def __init__(self, config: StandinConfig, port: Optional[int] = None) -> None:
+        self.port = port or free_port()
+        self.app = create_app(config)
+        self.server = uvicorn.Server(uvicorn.Config(self.app, host="127.0.0.1", port=self.port, log_level="warning"))
+        self._thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+
+    def stop(self) -> None:
+        self.server.should_exit = True
+        self._thread.join()
+
+    def env(self) -> Dict[str, str]:
+        """Base URL variables pointing the providers here"""
+        base = f"http://127.0.0.1:{self.port}"
+        return {var: base + prefix for var, prefix, _, _, _, _ in UPSTREAMS.values()}
+
+    def request_counts(self) -> Dict[str, int]:
+        return dict(self.app.state.requests)
+
+
+def record(query: str) -> None:
+    """Save fresh responses from the real APIs over the fixtures"""
+    params = {
+        "gutenberg": {"search": query, "languages": "pt"},
+        "openlibrary": {"q": query, "language": "por", "has_fulltext": "true", "limit": "60"},
+        "internetarchive": {
+            "q": f"{query} AND mediatype:(texts) AND language:(por)",
+            "fl[]": ["identifier", "title", "creator", "description", "downloads", "language", "subject", "date"],
+            "sort[]": "downloads desc",
+            "rows": "60",
+            "output": "json",
+        },
+        "annasarchive": {"q": query},
+    }
+    headers = {"User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36"}
+    with httpx.Client(timeout=60.0, follow_redirects=True, headers=headers) as client:
+        for name, (_, _, path, fixture, _, base_url) in UPSTREAMS.items():
+            try:
+                response = client.get(base_url + path, params=params[name])
+                response.raise_for_status()
+            except httpx.HTTPError as e:
+                print(f"{name}: {e}")
+                continue
+            with open(os.path.join(FIXTURES_DIR, fixture), "wb") as f:
+                f.write(response.content)
+            print(f"{name}: saved {len(response.content)} bytes to {fixture}")
+
+
+def parse_per_provider(value: str, scale: float = 1.0) -> Dict[str, float]:
+    """Either one value for every provider ("80") or per provider ("annasarchive=400,gutenberg=50")"""
+    if not value:
+        return {}
+    if "=" not in value:
+        return {name: float(value) * scale for name in UPSTREAMS}
+    result = {}
+    for part in value.split(","):
+        name, _, amount = part.partition("=")
+        if name.strip() not in UPSTREAMS:
+            raise argparse.ArgumentTypeError(f"unknown provider: {name}")
+        result[name.strip()] = float(amount) * scale
+    return result
+
+
+def add_config_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--latency", default="80", help="ms, for all providers or as provider=ms,...")
+    parser.add_argument("--jitter", type=float, default=0.2, help="latency jitter as a fraction")
+    parser.add_argument("--errors", default="", help="error rate, for all providers or as provider=rate,...")
+    parser.add_argument("--max-pages", type=int, default=3)
+
+
+def config_from_args(args: argparse.Namespace) -> StandinConfig:
+    return StandinConfig(
+        latency=parse_per_provider(args.latency, scale=0.001),
+        jitter=args.jitter,
+        error_rate=parse_per_provider(args.errors),
+        max_pages=args.max_pages,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--record", metavar="QUERY", help="refresh the fixtures from the real APIs and exit")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    if args.record:
+        record(args.record)
+        return
+
+    server = StandinServer(config_from_args(args), args.port)
+    for var, url in server.env().items():
+        print(f"export {var}={url}")
+    try:
+        server.server.run()
+    except KeyboardInterrupt:
+        sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
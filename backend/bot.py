@@ -1,82 +1,193 @@
 import os
 import asyncio
-import telebot
+import time
+from typing import Dict, Optional, Tuple
+
+from telebot.async_telebot import AsyncTeleBot
 from dotenv import load_dotenv
 
+import metrics
+from leader import run_as_leader
+from scheduler import Scheduler
+# Searches go through the API's cache, providers and HTTP clients
+from search_service import (
+    DEFAULT_SEARCH_LIMIT,
+    WARM_INTERVAL_SECONDS,
+    cached_search,
+    start_services,
+    stop_services,
+    warm_popular_queries,
+)
+
 # Load environment variables
 load_dotenv()
 
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
-if not TELEGRAM_BOT_TOKEN:
-    raise ValueError("TELEGRAM_BOT_TOKEN not found in environment variables")
 
-bot = telebot.TeleBot(TELEGRAM_BOT_TOKEN)
+# Created in run_bot, so importing this module never needs the token
+bot: Optional[AsyncTeleBot] = None
+
+# Searches run on a fixed pool of workers; messages beyond the queue are turned away
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "4"))
+BOT_QUEUE_SIZE = int(os.getenv("BOT_QUEUE_SIZE", "100"))
+
+# Per chat: bursts of up to 3 searches, then one every 5 seconds
+CHAT_BURST = 3
+CHAT_REFILL_SECONDS = 5.0
+
+# Results shown per search, to not flood the chat
+RESULTS_PER_MESSAGE = 5
+
+
+class ChatRateLimiter:
+    """Token bucket per chat id"""
+
+    def __init__(self, burst: int = CHAT_BURST, refill_seconds: float = CHAT_REFILL_SECONDS) -> None:
+        self.burst = burst
+        self.refill_seconds = refill_seconds
+        # chat id -> (tokens, last update)
+        self._buckets: Dict[int, Tuple[float, float]] = {}
+
+    def allow(self, chat_id: int) -> bool:
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(chat_id, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) / self.refill_seconds)
+        if tokens < 1:
+            self._buckets[chat_id] = (tokens, now)
+            return False
+        self._buckets[chat_id] = (tokens - 1, now)
+        self._prune(now)
+        return True
 
-# We need to access our providers to search for books
-from providers.gutenberg import GutenbergProvider
-from providers.openlibrary import OpenLibraryProvider
-from providers.internetarchive import InternetArchiveProvider
-from providers.annasarchive import AnnasArchiveProvider
+    def _prune(self, now: float) -> None:
+        # Chats idle long enough to be full again don't need a bucket
+        if len(self._buckets) < 10000:
+            return
+        full_after = self.burst * self.refill_seconds
+        self._buckets = {
+            chat_id: bucket for chat_id, bucket in self._buckets.items() if now - bucket[1] < full_after
+        }
+
+
+rate_limiter = ChatRateLimiter()
+# Created in run_bot, on the loop that polls
+search_queue: Optional["asyncio.Queue"] = None
+metrics.bot_queue_depth.set_function(lambda: search_queue.qsize() if search_queue is not None else 0)
 
-providers = [GutenbergProvider(), OpenLibraryProvider(), InternetArchiveProvider(), AnnasArchiveProvider()]
 
-@bot.message_handler(commands=['start', 'help'])
-def send_welcome(message):
+async def send_welcome(message):
     welcome_text = (
         "Olá! Sou o bot do OpenLibraryFREE 📚\n\n"
         "Me envie o nome de um livro, autor ou assunto, e eu buscarei para você em domínio público!\n\n"
         "Exemplo: 'Machado de Assis', 'Dom Casmurro'"
     )
-    bot.reply_to(message, welcome_text)
+    await bot.reply_to(message, welcome_text)
 
-@bot.message_handler(func=lambda message: True)
-def handle_search(message):
+async def handle_search(message):
     query = message.text
-    bot.reply_to(message, f"🔍 Buscando por '{query}'... aguarde um instante.")
+    if not rate_limiter.allow(message.chat.id):
+        await bot.reply_to(message, "⏳ Muitas buscas seguidas. Aguarde alguns segundos e tente de novo.")
+        return
+
+    busy = "😓 Estou com muitas buscas no momento. Tente novamente em instantes."
+    if search_queue.full():
+        await bot.reply_to(message, busy)
+        return
+
+    # Acknowledge before queueing: a cached answer can come back right away
+    await bot.reply_to(message, f"🔍 Buscando por '{query}'... aguarde um instante.")
+    try:
+        search_queue.put_nowait(message)
+    except asyncio.QueueFull:
+        # Filled up while the acknowledgement was being sent
+        await bot.reply_to(message, busy)
+
+
+def format_results(query: str, results: list) -> str:
+    response_text = f"📚 *Resultados para '{query}':*\n\n"
+    for i, book in enumerate(results[:RESULTS_PER_MESSAGE]):
+        response_text += f"*{i+1}. {book.title}*\n"
+        response_text += f"👤 Autor: {book.author or 'Desconhecido'}\n"
+        response_text += f"📖 Fonte: {book.source}\n"
+        if book.download_url:
+            response_text += f"⬇️ [Baixar Livro]({book.download_url})\n"
+        elif book.preview_url:
+            response_text += f"👀 [Ler Online]({book.preview_url})\n"
+        response_text += "\n"
+    return response_text
+
 
-    # Run the async code in a synchronous context using asyncio
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    
+async def answer_search(message) -> None:
+    query = message.text
     try:
-        results = loop.run_until_complete(perform_search(query))
-        
+        # Same page size as the site, so both hit the same cache entries
+        results, _ = await cached_search(query, DEFAULT_SEARCH_LIMIT)
+
         if not results:
-            bot.send_message(message.chat.id, "Nenhum livro encontrado para essa busca. Tente outros termos.")
+            await bot.send_message(message.chat.id, "Nenhum livro encontrado para essa busca. Tente outros termos.")
             return
 
-        response_text = f"📚 *Resultados para '{query}':*\n\n"
-        for i, book in enumerate(results[:5]): # Limits to 5 results to not flood chat
-            response_text += f"*{i+1}. {book.title}*\n"
-            response_text += f"👤 Autor: {book.author or 'Desconhecido'}\n"
-            response_text += f"📖 Fonte: {book.source}\n"
-            if book.download_url:
-                response_text += f"⬇️ [Baixar Livro]({book.download_url})\n"
-            elif book.preview_url:
-                response_text += f"👀 [Ler Online]({book.preview_url})\n"
-            response_text += "\n"
-        
-        bot.send_message(message.chat.id, response_text, parse_mode="Markdown", disable_web_page_preview=True)
+        await bot.send_message(
+            message.chat.id, format_results(query, results), parse_mode="Markdown", disable_web_page_preview=True
+        )
 
     except Exception as e:
         print(f"Error during bot search: {e}")
-        bot.send_message(message.chat.id, "Ocorreu um erro ao buscar os livros. Tente novamente mais tarde.")
-    finally:
-        loop.close()
-
-async def perform_search(query: str) -> list:
-    tasks = [provider.search(query, limit=5) for provider in providers]
-    provider_results = await asyncio.gather(*tasks, return_exceptions=True)
-
-    all_books = []
-    for res in provider_results:
-        if isinstance(res, Exception):
-            continue
-        if isinstance(res, list):
-            all_books.extend(res)
-            
-    return all_books
-
-def run_bot():
+        await bot.send_message(message.chat.id, "Ocorreu um erro ao buscar os livros. Tente novamente mais tarde.")
+
+
+async def search_worker(queue: "asyncio.Queue") -> None:
+    while True:
+        message = await queue.get()
+        try:
+            await answer_search(message)
+        except Exception as e:
+            # The error reply itself failed; keep the worker alive
+            print(f"Error answering bot search: {e}")
+        finally:
+            queue.task_done()
+
+
+def create_bot(token: str) -> AsyncTeleBot:
+    new_bot = AsyncTeleBot(token)
+    new_bot.register_message_handler(send_welcome, commands=['start', 'help'])
+    new_bot.register_message_handler(handle_search, func=lambda message: True)
+    return new_bot
+
+
+async def run_bot() -> None:
+    global bot, search_queue
+    if not TELEGRAM_BOT_TOKEN:
+        print("TELEGRAM_BOT_TOKEN not found in environment variables; the Telegram bot is disabled")
+        return
     print("Iniciando o Bot do Telegram...")
-    bot.polling(none_stop=True)
+    bot = create_bot(TELEGRAM_BOT_TOKEN)
+    search_queue = asyncio.Queue(maxsize=BOT_QUEUE_SIZE)
+    workers = [asyncio.create_task(search_worker(search_queue)) for _ in range(BOT_WORKERS)]
+    try:
+        await bot.infinity_polling()
+    finally:
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+
+async def main() -> None:
+    """Run the bot on its own, for API workers started with BOT_MODE=off"""
+    http_clients = await start_services()
+    scheduler = Scheduler()
+    # Warms what this process is asked; the API keeps the categories warm
+    scheduler.every(WARM_INTERVAL_SECONDS, warm_popular_queries)
+    scheduler.start()
+    try:
+        await run_as_leader("bot", run_bot)
+    finally:
+        await scheduler.stop()
+        await stop_services(http_clients)
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,392 @@
+import asyncio
+import os
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+from urllib.parse import unquote, urlsplit
+
+import metrics
+
+# Entries kept by the in-process backend, and by the near-cache in front of
+# a shared one
+MEMORY_MAX_ENTRIES = 10000
+# How long a node trusts its near-cache copy before asking the shared tier
+# again; bounds how stale one node's view of another node's writes can get
+NEAR_CACHE_SECONDS = float(os.getenv("NEAR_CACHE_SECONDS", "30"))
+
+# Keys per SQLite statement, under SQLite's bound-parameter limit
+SQLITE_CHUNK = 500
+# Expired rows are purged after this many writes
+SQLITE_PURGE_EVERY = 1000
+
+REDIS_POOL_SIZE = int(os.getenv("REDIS_POOL_SIZE", "8"))
+REDIS_TIMEOUT_SECONDS = 2.0
+# After Redis fails to answer, it is skipped (reads miss, writes are
+# dropped) for this long rather than retried on every request
+REDIS_RETRY_SECONDS = 5.0
+
+
+class CacheBackend(ABC):
+    """Byte-valued key/value store with per-entry TTLs and batched access.
+
+    Every backend takes and returns whole batches, so one round trip serves
+    a search entry's books however many there are.
+    """
+
+    @abstractmethod
+    async def get_many(self, keys: Sequence[str]) -> Dict[str, bytes]:
+        """Values of the keys that exist and haven't expired"""
+
+    @abstractmethod
+    async def set_many(self, items: Mapping[str, bytes], ttl: float) -> None:
+        """Store every item, each expiring `ttl` seconds from now"""
+
+    @abstractmethod
+    async def delete_many(self, keys: Sequence[str]) -> None:
+        pass
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return (await self.get_many([key])).get(key)
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        await self.set_many({key: value}, ttl)
+
+    async def aclose(self) -> None:
+        pass
+
+
+class MemoryBackend(CacheBackend):
+    """In-process LRU; nothing is shared, but nothing leaves the process either"""
+
+    def __init__(self, max_entries: int = MEMORY_MAX_ENTRIES) -> None:
+        self.max_entries = max_entries
+        # key -> (monotonic expiry time, value)
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+
+    async def get_many(self, keys: Sequence[str]) -> Dict[str, bytes]:
+        now = time.monotonic()
+        found = {}
+        for key in keys:
+            item = self._entries.get(key)
+            if item is None:
+                continue
+            if item[0] <= now:
+                del self._entries[key]
+                continue
+            self._entries.move_to_end(key)
+            found[key] = item[1]
+        return found
+
+    async def set_many(self, items: Mapping[str, bytes], ttl: float) -> None:
+        expires = time.monotonic() + ttl
+        for key, value in items.items():
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def delete_many(self, keys: Sequence[str]) -> None:
+        for key in keys:
+            self._entries.pop(key, None)
+
+
+class SqliteBackend(CacheBackend):
+    """A table in its own SQLite file, shared by every process on the host.
+
+    Expiry uses wall-clock time, since processes don't share a monotonic clock.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        # One connection, used from one thread: SQLite serializes writers anyway
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cache-db")
+        self._conn: Optional[sqlite3.Connection] = None
+        self._writes = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache "
+                "(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL) WITHOUT ROWID"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_expires_at ON cache (expires_at)")
+            self._conn = conn
+        return self._conn
+
+    async def _run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    def _get_many(self, keys: Sequence[str]) -> Dict[str, bytes]:
+        conn = self._connect()
+        now = time.time()
+        found: Dict[str, bytes] = {}
+        for start in range(0, len(keys), SQLITE_CHUNK):
+            chunk = list(keys[start:start + SQLITE_CHUNK])
+            placeholders = ",".join("?" * len(chunk))
+            rows = conn.execute(
+                f"SELECT key, value FROM cache WHERE key IN ({placeholders}) AND expires_at > ?", (*chunk, now)
+            )
+            found.update(rows)
+        return found
+
+    def _set_many(self, items: Mapping[str, bytes], ttl: float) -> None:
+        conn = self._connect()
+        now = time.time()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                "INSERT INTO cache (key, value, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at",
+                [(key, value, now + ttl) for key, value in items.items()],
+            )
+        self._writes += len(items)
+        if self._writes >= SQLITE_PURGE_EVERY:
+            self._writes = 0
+            conn.execute("DELETE FROM cache WHERE expires_at <= ?", (now,))
+
+    def _delete_many(self, keys: Sequence[str]) -> None:
+        conn = self._connect()
+        for start in range(0, len(keys), SQLITE_CHUNK):
+            chunk = list(keys[start:start + SQLITE_CHUNK])
+            conn.execute(f"DELETE FROM cache WHERE key IN ({','.join('?' * len(chunk))})", chunk)
+
+    async def get_many(self, keys: Sequence[str]) -> Dict[str, bytes]:
+        return await self._run(self._get_many, keys) if keys else {}
+
+    async def set_many(self, items: Mapping[str, bytes], ttl: float) -> None:
+        if items:
+            await self._run(self._set_many, items, ttl)
+
+    async def delete_many(self, keys: Sequence[str]) -> None:
+        if keys:
+            await self._run(self._delete_many, keys)
+
+    async def aclose(self) -> None:
+        def close() -> None:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+        await self._run(close)
+        self._executor.shutdown(wait=False)
+
+
+class RedisError(Exception):
+    pass
+
+
+def encode_command(*args: object) -> bytes:
+    """RESP array of bulk strings"""
+    out = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+        out.append(b"$%d\r\n%s\r\n" % (len(data), data))
+    return b"".join(out)
+
+
+async def read_reply(reader: asyncio.StreamReader) -> object:
+    line = await reader.readline()
+    if not line.endswith(b"\r\n"):
+        raise ConnectionError("Connection closed by the Redis server")
+    kind, rest = line[:1], line[1:-2]
+    if kind == b"+":
+        return rest.decode()
+    if kind == b"-":
+        return RedisError(rest.decode())
+    if kind == b":":
+        return int(rest)
+    if kind == b"$":
+        length = int(rest)
+        if length == -1:
+            return None
+        data = await reader.readexactly(length + 2)
+        return data[:-2]
+    if kind == b"*":
+        count = int(rest)
+        if count == -1:
+            return None
+        return [await read_reply(reader) for _ in range(count)]
+    raise RedisError(f"Unexpected reply: {line!r}")
+
+
+class _RedisConnection:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.reader = reader
+        self.writer = writer
+
+    async def pipeline(self, commands: Sequence[Tuple[object, ...]]) -> List[object]:
+        """Send every command, then read every reply: one round trip"""
+        self.writer.write(b"".join(encode_command(*command) for command in commands))
+        await self.writer.drain()
+        return [await read_reply(self.reader) for _ in commands]
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+class RedisBackend(CacheBackend):
+    """Minimal RESP2 client over asyncio streams: MGET for batched reads,
+    pipelined SET ... PX for batched writes. Anything speaking the Redis
+    protocol works (Redis, Valkey, KeyDB, benchmarks/redis_standin.py).
+
+    The cache is best-effort: connecting and each round trip share one
+    timeout, and a server that is down or unreachable is left alone for
+    `retry_seconds` instead of holding up every lookup.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 6379,
+        db: int = 0,
+        password: Optional[str] = None,
+        pool_size: int = REDIS_POOL_SIZE,
+        timeout: float = REDIS_TIMEOUT_SECONDS,
+        retry_seconds: float = REDIS_RETRY_SECONDS,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.timeout = timeout
+        self.retry_seconds = retry_seconds
+        self._down_until = 0.0
+        self._idle: List[_RedisConnection] = []
+        self._slots = asyncio.Semaphore(pool_size)
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisBackend":
+        parts = urlsplit(url)
+        db = int(parts.path.lstrip("/") or 0)
+        password = unquote(parts.password) if parts.password else None
+        return cls(parts.hostname or "127.0.0.1", parts.port or 6379, db, password)
+
+    async def _connect(self) -> _RedisConnection:
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        conn = _RedisConnection(reader, writer)
+        setup = []
+        if self.password:
+            setup.append(("AUTH", self.password))
+        if self.db:
+            setup.append(("SELECT", self.db))
+        if setup:
+            for reply in await conn.pipeline(setup):
+                if isinstance(reply, RedisError):
+                    conn.close()
+                    raise reply
+        return conn
+
+    def _backing_off(self) -> bool:
+        return time.monotonic() < self._down_until
+
+    async def execute(self, commands: Sequence[Tuple[object, ...]]) -> List[object]:
+        async with self._slots:
+            conn = self._idle.pop() if self._idle else None
+
+            async def round_trip() -> List[object]:
+                nonlocal conn
+                if conn is None:
+                    conn = await self._connect()
+                return await conn.pipeline(commands)
+
+            try:
+                replies = await asyncio.wait_for(round_trip(), self.timeout)
+            except BaseException as e:
+                # Replies may be half read; the connection can't be reused
+                if conn is not None:
+                    conn.close()
+                if isinstance(e, (OSError, EOFError, asyncio.TimeoutError)):
+                    if not self._backing_off():
+                        print(f"Redis at {self.host}:{self.port} unreachable ({e!r}); skipping it for {self.retry_seconds}s")
+                    self._down_until = time.monotonic() + self.retry_seconds
+                raise
+            self._idle.append(conn)
+        for reply in replies:
+            if isinstance(reply, RedisError):
+                raise reply
+        return replies
+
+    async def get_many(self, keys: Sequence[str]) -> Dict[str, bytes]:
+        if not keys or self._backing_off():
+            return {}
+        (values,) = await self.execute([("MGET", *keys)])
+        return {key: value for key, value in zip(keys, values) if value is not None}
+
+    async def set_many(self, items: Mapping[str, bytes], ttl: float) -> None:
+        if items and not self._backing_off():
+            ttl_ms = max(1, int(ttl * 1000))
+            await self.execute([("SET", key, value, "PX", ttl_ms) for key, value in items.items()])
+
+    async def delete_many(self, keys: Sequence[str]) -> None:
+        if keys and not self._backing_off():
+            await self.execute([("DEL", *keys)])
+
+    async def aclose(self) -> None:
+        idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+class TieredBackend(CacheBackend):
+    """A per-process near-cache in front of a shared backend.
+
+    Reads hit the near-cache first and fetch only what's missing; writes go
+    to both. Near-cache copies live at most `near_ttl` seconds, so a node
+    picks up other nodes' writes within that time.
+    """
+
+    def __init__(self, near: CacheBackend, far: CacheBackend, near_ttl: float = NEAR_CACHE_SECONDS) -> None:
+        self.near = near
+        self.far = far
+        self.near_ttl = near_ttl
+
+    async def get_many(self, keys: Sequence[str]) -> Dict[str, bytes]:
+        found = await self.near.get_many(keys)
+        metrics.near_cache_requests.labels("hit").inc(len(found))
+        missing = [key for key in keys if key not in found]
+        if missing:
+            metrics.near_cache_requests.labels("miss").inc(len(missing))
+            fetched = await self.far.get_many(missing)
+            if fetched:
+                await self.near.set_many(fetched, self.near_ttl)
+            found.update(fetched)
+        return found
+
+    async def set_many(self, items: Mapping[str, bytes], ttl: float) -> None:
+        await self.far.set_many(items, ttl)
+        await self.near.set_many(items, min(ttl, self.near_ttl))
+
+    async def delete_many(self, keys: Sequence[str]) -> None:
+        await self.near.delete_many(keys)
+        await self.far.delete_many(keys)
+
+    async def aclose(self) -> None:
+        await self.near.aclose()
+        await self.far.aclose()
+
+
+def create_backend(url: str, near_ttl: float = NEAR_CACHE_SECONDS) -> CacheBackend:
+    """Backend for a CACHE_URL: memory://, sqlite:///path/to/file.db or
+    redis://[:password@]host[:port][/db]. Shared backends get a near-cache
+    unless `near_ttl` is 0.
+    """
+    scheme = urlsplit(url).scheme
+    if scheme == "memory":
+        return MemoryBackend()
+    if scheme == "sqlite":
+        backend: CacheBackend = SqliteBackend(url[len("sqlite:///"):] or "cache.db")
+    elif scheme == "redis":
+        backend = RedisBackend.from_url(url)
+    else:
+        raise ValueError(f"Unsupported cache URL: {url}")
+    if near_ttl > 0:
+        return TieredBackend(MemoryBackend(), backend, near_ttl)
+    return backend
@@ -0,0 +1,102 @@
+import json
+import os
+import threading
+import time
+from types import MappingProxyType
+from typing import Mapping, Optional, Tuple
+
+import schemas
+from http_cache import compress, content_etag, supported_encodings, variant_etag
+
+PRELOADED_BOOKS_PATH = os.path.join(os.path.dirname(__file__), "preloaded_books.json")
+
+# How many books of each shelf the homepage rows show
+SHELF_LIMITS = {"destaques": 12, "fantasy": 30}
+
+# The file is stat()ed at most this often to notice edits
+RELOAD_CHECK_SECONDS = 1.0
+
+
+class Shelf:
+    """One homepage row, serialized once: response bytes per content-coding, with ETags"""
+
+    def __init__(self, books: Tuple[schemas.BookDetails, ...]) -> None:
+        self.books = books
+        body = json.dumps(
+            [book.model_dump() for book in books], ensure_ascii=False, separators=(",", ":")
+        ).encode("utf-8")
+        etag = content_etag(body)
+
+        variants = {"identity": (body, etag)}
+        for encoding in supported_encodings():
+            variants[encoding] = (compress(body, encoding), variant_etag(etag, encoding))
+        # encoding -> (body, etag)
+        self.variants: Mapping[str, Tuple[bytes, str]] = MappingProxyType(variants)
+
+
+class CatalogSnapshot:
+    def __init__(self, shelves: Mapping[str, Shelf], version: Optional[Tuple[int, int]]) -> None:
+        self.shelves = MappingProxyType(dict(shelves))
+        # (mtime_ns, size) of the file this snapshot was built from
+        self.version = version
+
+
+def _read_version(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def build_snapshot(path: str) -> CatalogSnapshot:
+    version = _read_version(path)
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    shelves = {}
+    for name, limit in SHELF_LIMITS.items():
+        books = tuple(schemas.BookDetails.model_validate(item) for item in data.get(name, [])[:limit])
+        shelves[name] = Shelf(books)
+    return CatalogSnapshot(shelves, version)
+
+
+class PreloadedCatalog:
+    """preloaded_books.json, loaded once and swapped atomically when the file changes"""
+
+    def __init__(self, path: str = PRELOADED_BOOKS_PATH) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self._snapshot = CatalogSnapshot({name: Shelf(()) for name in SHELF_LIMITS}, None)
+        self.reload()
+
+    def reload(self) -> None:
+        try:
+            snapshot = build_snapshot(self.path)
+        except Exception as e:
+            # Keep serving the previous snapshot
+            print(f"Error loading preloaded books: {e}")
+            return
+        self._snapshot = snapshot
+
+    def snapshot(self) -> CatalogSnapshot:
+        now = time.monotonic()
+        if now - self._checked_at >= RELOAD_CHECK_SECONDS:
+            self._checked_at = now
+            version = _read_version(self.path)
+            if version is not None and version != self._snapshot.version:
+                with self._lock:
+                    if version != self._snapshot.version:
+                        self.reload()
+        return self._snapshot
+
+    def shelf(self, name: str) -> Shelf:
+        return self.snapshot().shelves[name]
+
+    def find_book(self, book_id: str) -> Optional[schemas.BookDetails]:
+        for shelf in self.snapshot().shelves.values():
+            for book in shelf.books:
+                if book.id == book_id:
+                    return book
+        return None
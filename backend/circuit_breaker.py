@@ -0,0 +1,147 @@
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+# Open after this many failures in a row...
+FAILURE_THRESHOLD = 5
+# ...or when at least MIN_CALLS calls in the window failed at this rate
+ERROR_RATE_THRESHOLD = 0.5
+MIN_CALLS = 10
+WINDOW_SECONDS = 60.0
+# How long an open circuit rejects calls before letting a probe through
+OPEN_SECONDS = 30.0
+
+
+class CircuitBreaker:
+    """Rolling error-rate circuit breaker for one upstream provider.
+
+    closed -> open after repeated failures; open -> half_open once the
+    cool-down passes, letting a single probe through; the probe's outcome
+    closes the circuit again or re-opens it.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = FAILURE_THRESHOLD,
+        error_rate_threshold: float = ERROR_RATE_THRESHOLD,
+        min_calls: int = MIN_CALLS,
+        window_seconds: float = WINDOW_SECONDS,
+        open_seconds: float = OPEN_SECONDS,
+    ) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.error_rate_threshold = error_rate_threshold
+        self.min_calls = min_calls
+        self.window_seconds = window_seconds
+        self.open_seconds = open_seconds
+
+        self.state = STATE_CLOSED
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.probe_in_flight = False
+        # (timestamp, succeeded, latency seconds)
+        self._calls: Deque[Tuple[float, bool, float]] = deque()
+
+    def allow(self) -> bool:
+        """Whether a call may go out now. Claims the probe slot when half-open."""
+        if self.state == STATE_OPEN:
+            assert self.opened_at is not None
+            if time.monotonic() - self.opened_at < self.open_seconds:
+                return False
+            self.state = STATE_HALF_OPEN
+            self.probe_in_flight = False
+
+        if self.state == STATE_HALF_OPEN:
+            if self.probe_in_flight:
+                return False
+            self.probe_in_flight = True
+
+        return True
+
+    def record_success(self, latency: float) -> None:
+        self._record(True, latency)
+        self.consecutive_failures = 0
+        if self.state == STATE_HALF_OPEN:
+            self._close()
+
+    def record_failure(self, latency: float) -> None:
+        self._record(False, latency)
+        self.consecutive_failures += 1
+        if self.state == STATE_HALF_OPEN:
+            self._open()
+        elif self.state == STATE_CLOSED and self._should_open():
+            self._open()
+
+    def release_probe(self) -> None:
+        """Give back the half-open probe slot when a call was abandoned unmeasured"""
+        self.probe_in_flight = False
+
+    def snapshot(self) -> dict:
+        self._prune()
+        calls = len(self._calls)
+        failures = sum(1 for _, ok, _ in self._calls if not ok)
+        latency = sum(seconds for _, _, seconds in self._calls) / calls if calls else None
+        # Report a lapsed open circuit as half-open without claiming the probe
+        state = self.state
+        retry_in = None
+        if state == STATE_OPEN and self.opened_at is not None:
+            retry_in = max(0.0, self.open_seconds - (time.monotonic() - self.opened_at))
+            if retry_in == 0.0:
+                state = STATE_HALF_OPEN
+        return {
+            "name": self.name,
+            "state": state,
+            "calls": calls,
+            "failures": failures,
+            "error_rate": failures / calls if calls else 0.0,
+            "avg_latency": latency,
+            "consecutive_failures": self.consecutive_failures,
+            "retry_in": retry_in,
+        }
+
+    def _record(self, ok: bool, latency: float) -> None:
+        self._calls.append((time.monotonic(), ok, latency))
+        self._prune()
+
+    def _prune(self) -> None:
+        cutoff = time.monotonic() - self.window_seconds
+        while self._calls and self._calls[0][0] < cutoff:
+            self._calls.popleft()
+
+    def _should_open(self) -> bool:
+        if self.consecutive_failures >= self.failure_threshold:
+            return True
+        if len(self._calls) < self.min_calls:
+            return False
+        failures = sum(1 for _, ok, _ in self._calls if not ok)
+        return failures / len(self._calls) >= self.error_rate_threshold
+
+    def _open(self) -> None:
+        if self.state != STATE_OPEN:
+            print(f"Circuit for provider '{self.name}' opened")
+        self.state = STATE_OPEN
+        self.opened_at = time.monotonic()
+        self.probe_in_flight = False
+
+    def _close(self) -> None:
+        print(f"Circuit for provider '{self.name}' closed")
+        self.state = STATE_CLOSED
+        self.opened_at = None
+        self.probe_in_flight = False
+        self.consecutive_failures = 0
+        self._calls.clear()
+
+
+breakers: Dict[str, CircuitBreaker] = {}
+
+
+def breaker_for(name: str) -> CircuitBreaker:
+    breaker = breakers.get(name)
+    if breaker is None:
+        breaker = breakers[name] = CircuitBreaker(name)
+    return breaker
@@ -0,0 +1,290 @@
+import asyncio
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+import metrics
+from leader import FileLock
+from singleflight import SingleFlight
+from upstream import host_of, retry_after_seconds, upstream_scheduler
+
+try:
+    from PIL import Image
+except ImportError:  # pragma: no cover - without Pillow originals are served as-is
+    Image = None
+
+COVER_CACHE_DIR = os.getenv("COVER_CACHE_DIR", os.path.join(os.path.dirname(__file__), "cover_cache"))
+COVER_CACHE_MAX_BYTES = int(os.getenv("COVER_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+# Covers larger than this are refused rather than cached
+MAX_COVER_BYTES = 5 * 1024 * 1024
+
+# Hosts (and their subdomains) covers may be fetched from. Cover URLs come
+# from scraped pages, so the proxy checks every redirect hop against these
+# rather than fetching whatever a stored URL points at.
+COVER_HOSTS = (
+    "covers.openlibrary.org",
+    "archive.org",
+    "gutenberg.org",
+    "libgen.li",
+    "i.gr-assets.com",
+    "babel.hathitrust.org",
+    "images.isbndb.com",
+) + tuple(filter(None, (host.strip() for host in os.getenv("COVER_HOSTS_EXTRA", "").split(","))))
+MAX_REDIRECTS = 5
+# Every cover fetch shares one pool, whatever the host
+COVER_MAX_CONNECTIONS = 20
+COVER_TIMEOUT_SECONDS = 10.0
+
+# Bounding boxes for resized variants; aspect ratio is preserved
+SIZES = {"card": (240, 360), "detail": (600, 900)}
+FORMATS = {"webp": ("WEBP", "image/webp"), "jpeg": ("JPEG", "image/jpeg")}
+QUALITY = 80
+
+
+class CoverStore:
+    """Content-addressed on-disk cover cache with a size cap and LRU eviction.
+
+    Originals live at blobs/<hh>/<sha256 of content>, resized variants next
+    to them as <sha256>.<size>.<format>; refs/<sha256 of url> holds the
+    content hash for a cover URL. File mtimes track recency, so the LRU
+    order survives restarts and is shared by every worker using the
+    directory. Each process only sees its own writes between scans, so
+    eviction rescans the directory under a lock file before deleting.
+    """
+
+    def __init__(self, root: str = COVER_CACHE_DIR, max_bytes: int = COVER_CACHE_MAX_BYTES) -> None:
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # path -> size, least recently used first
+        self._files: "OrderedDict[str, int]" = OrderedDict()
+        self._total = 0
+        # Other workers write to the same directory unseen; rescan after
+        # this many bytes of our own writes even if the cap isn't reached
+        self._rescan_bytes = max(max_bytes // 16, 1)
+        self._written = 0
+        # Serializes eviction across every process sharing the directory
+        self._evict_lock = FileLock(os.path.join(root, "evict.lock"))
+        # Concurrent requests for the same key share one fetch/resize
+        self._inflight = SingleFlight()
+        os.makedirs(os.path.join(self.root, "blobs"), exist_ok=True)
+        os.makedirs(os.path.join(self.root, "refs"), exist_ok=True)
+        with self._lock:
+            self._scan()
+
+    def _scan(self) -> None:
+        """Rebuild the index from disk; the caller holds self._lock"""
+        found = []
+        for dirpath, _, filenames in os.walk(os.path.join(self.root, "blobs")):
+            for filename in filenames:
+                # Another worker's write in progress
+                if filename.endswith(".tmp"):
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                found.append((stat.st_mtime, path, stat.st_size))
+
+        self._files.clear()
+        self._total = 0
+        self._written = 0
+        for _, path, size in sorted(found):
+            self._files[path] = size
+            self._total += size
+
+    def _evict(self) -> None:
+        """Trim the directory to max_bytes, counting every worker's files"""
+        with self._evict_lock:
+            self._scan()
+            while self._total > self.max_bytes and len(self._files) > 1:
+                old_path, old_size = self._files.popitem(last=False)
+                self._total -= old_size
+                try:
+                    os.remove(old_path)
+                except OSError:
+                    pass
+
+    def _blob_path(self, digest: str, suffix: str = "") -> str:
+        return os.path.join(self.root, "blobs", digest[:2], digest + suffix)
+
+    def _ref_path(self, url: str) -> str:
+        return os.path.join(self.root, "refs", hashlib.sha256(url.encode("utf-8")).hexdigest())
+
+    def _read(self, path: str) -> Optional[bytes]:
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        with self._lock:
+            if path in self._files:
+                self._files.move_to_end(path)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def _write(self, path: str, data: bytes) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._total += len(data) - self._files.pop(path, 0)
+            self._files[path] = len(data)
+            self._written += len(data)
+            if self._total > self.max_bytes or self._written >= self._rescan_bytes:
+                self._evict()
+
+    def original_digest(self, url: str) -> Optional[str]:
+        try:
+            with open(self._ref_path(url), "r", encoding="ascii") as f:
+                digest = f.read().strip()
+        except OSError:
+            return None
+        # The blob may have been evicted since
+        return digest if os.path.exists(self._blob_path(digest)) else None
+
+    def store_original(self, url: str, data: bytes) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(digest)
+        if not os.path.exists(path):
+            self._write(path, data)
+        ref_path = self._ref_path(url)
+        with open(ref_path + ".tmp", "w", encoding="ascii") as f:
+            f.write(digest)
+        os.replace(ref_path + ".tmp", ref_path)
+        return digest
+
+    def variant(self, digest: str, size: str, fmt: str) -> Optional[bytes]:
+        """Resized cover bytes, rendering and caching the variant on first use"""
+        path = self._blob_path(digest, f".{size}.{fmt}")
+        data = self._read(path)
+        if data is not None:
+            return data
+
+        original = self.original(digest)
+        if original is None:
+            return None
+        data = render_variant(original, size, fmt)
+        self._write(path, data)
+        return data
+
+    def original(self, digest: str) -> Optional[bytes]:
+        return self._read(self._blob_path(digest))
+
+    async def coalesce(self, key: str, fn: Callable[[], Awaitable]) -> object:
+        return await self._inflight.do(key, fn)
+
+
+class CoverNotAllowed(ValueError):
+    pass
+
+
+def cover_allowed(url: str) -> bool:
+    parts = urlsplit(url)
+    host = (parts.hostname or "").lower()
+    try:
+        port = parts.port
+    except ValueError:
+        return False
+    if parts.scheme not in ("http", "https") or port not in (None, 80, 443):
+        return False
+    return any(host == allowed or host.endswith("." + allowed) for allowed in COVER_HOSTS)
+
+
+def create_cover_client() -> httpx.AsyncClient:
+    limits = httpx.Limits(max_connections=COVER_MAX_CONNECTIONS, max_keepalive_connections=COVER_MAX_CONNECTIONS)
+    return httpx.AsyncClient(limits=limits, timeout=COVER_TIMEOUT_SECONDS)
+
+
+async def fetch_cover(client: httpx.AsyncClient, url: str) -> bytes:
+    # Covers come from the same hosts as searches, so they share their limits
+    async with upstream_scheduler.slot(url) as limiter:
+        for _ in range(MAX_REDIRECTS + 1):
+            if not cover_allowed(url):
+                raise CoverNotAllowed(f"Cover host not allowed: {url}")
+            async with client.stream("GET", url, follow_redirects=False) as response:
+                if host_of(url) == limiter.host:
+                    limiter.observe(response.status_code, retry_after_seconds(response.headers.get("Retry-After")))
+                if response.is_redirect:
+                    url = str(response.url.join(response.headers["Location"]))
+                    continue
+                response.raise_for_status()
+                data = bytearray()
+                async for chunk in response.aiter_bytes():
+                    data.extend(chunk)
+                    if len(data) > MAX_COVER_BYTES:
+                        raise ValueError(f"Cover larger than {MAX_COVER_BYTES} bytes: {url}")
+                return bytes(data)
+    raise ValueError(f"Too many redirects fetching cover: {url}")
+
+
+def render_variant(original: bytes, size: str, fmt: str) -> bytes:
+    image = Image.open(io.BytesIO(original))
+    image.draft("RGB", SIZES[size])  # lets JPEG decode at a reduced scale
+    image = image.convert("RGB")
+    image.thumbnail(SIZES[size])
+
+    out = io.BytesIO()
+    pil_format, _ = FORMATS[fmt]
+    image.save(out, pil_format, quality=QUALITY, optimize=fmt == "jpeg")
+    return out.getvalue()
+
+
+def sniff_media_type(data: bytes) -> str:
+    if data.startswith(b"\xff\xd8"):
+        return "image/jpeg"
+    if data.startswith(b"\x89PNG"):
+        return "image/png"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    return "application/octet-stream"
+
+
+async def get_cover(
+    store: CoverStore,
+    url: str,
+    size: str,
+    fmt: str,
+    fetch: Callable[[str], Awaitable[bytes]],
+) -> Tuple[bytes, str, str]:
+    """Return (body, media type, etag) for a cover, fetching the original at most once"""
+
+    async def load_original() -> str:
+        digest = await asyncio.to_thread(store.original_digest, url)
+        metrics.cover_cache_requests.labels("hit" if digest is not None else "miss").inc()
+        if digest is None:
+            data = await fetch(url)
+            digest = await asyncio.to_thread(store.store_original, url, data)
+        return digest
+
+    digest = await store.coalesce(f"url:{url}", load_original)
+
+    if Image is None:
+        # No Pillow: serve the original
+        original = await asyncio.to_thread(store.original, digest)
+        if original is None:
+            raise LookupError("cover evicted while serving")
+        return original, sniff_media_type(original), f'"{digest[:32]}"'
+
+    async def load_variant() -> Optional[bytes]:
+        return await asyncio.to_thread(store.variant, digest, size, fmt)
+
+    data = await store.coalesce(f"variant:{digest}:{size}:{fmt}", load_variant)
+    if data is None:
+        raise LookupError("cover evicted while serving")
+    return data, FORMATS[fmt][1], f'"{digest[:32]}-{size}-{fmt}"'
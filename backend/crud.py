@@ -0,0 +1,74 @@
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+import metrics
+import models
+import schemas
+
+BOOK_FIELDS = [
+    "title",
+    "author",
+    "language",
+    "source",
+    "download_url",
+    "preview_url",
+    "cover_url",
+    "summary",
+]
+
+# Keeps each statement well under SQLite's bound-parameter limit
+UPSERT_CHUNK_SIZE = 500
+
+
+def upsert_books(db: Session, books: List[schemas.BookDetails]) -> None:
+    """Insert or refresh every field of the given books in one statement per chunk"""
+    # Last occurrence wins when a batch carries the same id twice
+    rows = {book.id: book for book in books}
+    if not rows:
+        return
+
+    now = datetime.utcnow()
+    values = [
+        {"id": book.id, "created_at": now, **{field: getattr(book, field) for field in BOOK_FIELDS}}
+        for book in rows.values()
+    ]
+
+    with metrics.db_upsert_duration.time():
+        for start in range(0, len(values), UPSERT_CHUNK_SIZE):
+            stmt = sqlite_insert(models.BookCache).values(values[start:start + UPSERT_CHUNK_SIZE])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[models.BookCache.id],
+                set_={field: stmt.excluded[field] for field in BOOK_FIELDS},
+            )
+            db.execute(stmt)
+    metrics.db_upsert_rows.inc(len(values))
+
+
+DEFAULT_CATEGORIES = [
+    {"nome": "Fantasia", "cor": "#8b5cf6", "adulto": False},
+    {"nome": "Dark", "cor": "#1f2937", "adulto": True},
+    {"nome": "Estudo", "cor": "#3b82f6", "adulto": False},
+]
+
+
+def seed_categories(db: Session) -> None:
+    # Processes seeding at the same time each insert whatever is still missing
+    stmt = sqlite_insert(models.Category).values(DEFAULT_CATEGORIES)
+    db.execute(stmt.on_conflict_do_nothing(index_elements=[models.Category.nome]))
+
+
+def get_category_names(db: Session) -> List[str]:
+    return [row.nome for row in db.query(models.Category.nome).all()]
+
+
+def get_book(db: Session, book_id: str) -> Optional[schemas.BookDetails]:
+    row = db.get(models.BookCache, book_id)
+    return schemas.book_from_row(row) if row else None
+
+
+def get_cover_url(db: Session, book_id: str) -> Optional[str]:
+    row = db.query(models.BookCache.cover_url).filter(models.BookCache.id == book_id).first()
+    return row.cover_url if row else None
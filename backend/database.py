@@ -1,4 +1,13 @@
-from sqlalchemy import create_engine
+import asyncio
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, TypeVar
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import declarative_base, sessionmaker
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./books.db"
@@ -10,6 +19,37 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
+# Threads dedicated to SQLite work, so queries never run on the event loop.
+# WAL lets these readers proceed while the write-behind worker commits.
+DB_WORKERS = int(os.getenv("DB_WORKERS", "4"))
+db_executor = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix="db")
+
+T = TypeVar("T")
+
+# busy_timeout covers most waits for a write lock held by another process
+# (several API workers, the standalone bot). A transaction that still fails
+# with "database is locked" (timeout expired under load, or a read that
+# couldn't be upgraded to a write) is rolled back and re-run.
+LOCKED_RETRIES = 5
+LOCKED_BACKOFF_SECONDS = 0.05
+
+
+@event.listens_for(engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    cursor = dbapi_connection.cursor()
+    # Readers don't block the writer (and vice versa)
+    cursor.execute("PRAGMA journal_mode=WAL")
+    # Durable at checkpoints; a crash can only lose the last commits, never corrupt
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    # Wait for a competing writer instead of failing with "database is locked"
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.execute("PRAGMA cache_size=-32000")  # 32 MB page cache per connection
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA mmap_size=268435456")
+    # INSERT OR REPLACE must fire delete triggers to keep books_fts in sync
+    cursor.execute("PRAGMA recursive_triggers=ON")
+    cursor.close()
+
 
 def get_db():
     db = SessionLocal()
@@ -17,3 +57,37 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def is_locked_error(error: Exception) -> bool:
+    message = str(error).lower()
+    return isinstance(error, OperationalError) and ("database is locked" in message or "busy" in message)
+
+
+def _run_in_session(fn: Callable[..., T], *args: Any) -> T:
+    attempt = 0
+    while True:
+        db = SessionLocal()
+        try:
+            result = fn(db, *args)
+            db.commit()
+            return result
+        except Exception as e:
+            db.rollback()
+            if not is_locked_error(e) or attempt >= LOCKED_RETRIES:
+                raise
+        finally:
+            db.close()
+        time.sleep(LOCKED_BACKOFF_SECONDS * 2 ** attempt * random.uniform(0.5, 1.5))
+        attempt += 1
+
+
+async def run_db(fn: Callable[..., T], *args: Any) -> T:
+    """Run fn(session, *args) on the DB executor and commit, retrying if
+    another process holds the write lock.
+
+    Return plain values or Pydantic models: the session is closed before
+    the result reaches the caller.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_executor, partial(_run_in_session, fn, *args))
@@ -0,0 +1,209 @@
+import asyncio
+import time
+from collections import deque
+from functools import partial
+from typing import AsyncIterator, Deque, Dict, List, Mapping, Optional, Sequence, Set
+
+import metrics
+import schemas
+from circuit_breaker import breaker_for
+from providers.base import BookProvider
+from search_cache import normalize_query
+from singleflight import SingleFlight
+
+STATUS_OK = "ok"
+STATUS_ERROR = "error"
+STATUS_TIMEOUT = "timeout"
+STATUS_CIRCUIT_OPEN = "circuit_open"
+# Answered from the search cache without calling the provider
+STATUS_CACHED = "cached"
+# Joined an identical provider search already in flight
+STATUS_COALESCED = "coalesced"
+
+# Hedging only kicks in once we know a provider's normal latency
+HEDGE_MIN_SAMPLES = 20
+LATENCY_WINDOW = 200
+
+
+class LatencyTracker:
+    """Rolling window of successful call durations for one provider"""
+
+    def __init__(self, window: int = LATENCY_WINDOW) -> None:
+        self.samples: Deque[float] = deque(maxlen=window)
+
+    def record(self, seconds: float) -> None:
+        self.samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if len(self.samples) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+latencies: Dict[str, LatencyTracker] = {}
+
+# Identical provider searches in flight at the same time go upstream once.
+# Cancelled when every caller has timed out, like a single caller's request.
+provider_flights = SingleFlight(cancel_abandoned=True)
+
+
+def latency_for(provider: BookProvider) -> LatencyTracker:
+    tracker = latencies.get(provider.name)
+    if tracker is None:
+        tracker = latencies[provider.name] = LatencyTracker()
+    return tracker
+
+
+async def call_provider(
+    provider: BookProvider, query: str, limit: int, hedge: bool = False, page: int = 1
+) -> List[schemas.BookDetails]:
+    """Run one provider search, optionally hedged.
+
+    With `hedge`, a second identical request is sent once the first has run
+    past the provider's p95 latency; whichever answers first wins and the
+    other is cancelled.
+    """
+    tracker = latency_for(provider)
+    started = time.monotonic()
+
+    primary = asyncio.create_task(provider.search(query, limit, page))
+    attempts = [primary]
+    try:
+        p95 = tracker.percentile(0.95) if hedge else None
+        if p95 is not None:
+            done, _ = await asyncio.wait([primary], timeout=p95)
+            if not done:
+                attempts.append(asyncio.create_task(provider.search(query, limit, page)))
+
+        while True:
+            done, _ = await asyncio.wait(attempts, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                attempts.remove(task)
+                # A failed attempt only counts if there is nothing left to wait for
+                if task.exception() is None or not attempts:
+                    books = task.result()
+                    tracker.record(time.monotonic() - started)
+                    return books
+    finally:
+        for task in attempts:
+            task.cancel()
+
+
+def record_call(provider: str, status: str, elapsed: Optional[float] = None, books: int = 0) -> None:
+    metrics.provider_calls.labels(provider, status).inc()
+    if elapsed is not None:
+        metrics.provider_call_duration.labels(provider).observe(elapsed)
+    if books:
+        metrics.provider_results.labels(provider).inc(books)
+
+
+class ProviderResult:
+    def __init__(
+        self,
+        provider: str,
+        status: str,
+        books: Optional[List[schemas.BookDetails]] = None,
+        elapsed: float = 0.0,
+        error: Optional[str] = None,
+    ) -> None:
+        self.provider = provider
+        self.status = status
+        self.books = books or []
+        self.elapsed = elapsed
+        self.error = error
+
+
+async def iter_provider_results(
+    providers: Sequence[BookProvider],
+    query: str,
+    limit: int,
+    timeout: Optional[float] = None,
+    hedge: bool = False,
+    pages: Optional[Mapping[str, int]] = None,
+    failure_after: Optional[float] = None,
+) -> AsyncIterator[ProviderResult]:
+    """Yield each provider's result as soon as it completes.
+
+    Providers whose circuit is open are skipped (STATUS_CIRCUIT_OPEN).
+    Providers still running when `timeout` expires are cancelled and
+    reported with STATUS_TIMEOUT. Closing the iterator early cancels
+    whatever is still in flight. A provider search identical to one already
+    in flight joins it instead of going upstream again. `pages` picks the
+    page asked of each provider (default 1).
+
+    A timeout only counts against a provider's circuit once the call has
+    run past the provider's own timeout or `failure_after` seconds, so a
+    caller's short `timeout` can't open circuits for everyone else.
+    """
+    started = time.monotonic()
+    deadline = started + timeout if timeout is not None else None
+    pending: Dict["asyncio.Task", BookProvider] = {}
+    skipped: List[BookProvider] = []
+    # Providers this call joined instead of calling: the caller that went
+    # upstream owns the breaker accounting for them
+    followers: Set[str] = set()
+    for provider in providers:
+        page = pages.get(provider.name, 1) if pages else 1
+        key = (provider.name, normalize_query(query), limit, page)
+        if key in provider_flights:
+            followers.add(provider.name)
+            record_call(provider.name, STATUS_COALESCED)
+        elif not breaker_for(provider.name).allow():
+            skipped.append(provider)
+            record_call(provider.name, STATUS_CIRCUIT_OPEN)
+            continue
+        waiter, _ = provider_flights.join(key, partial(call_provider, provider, query, limit, hedge, page))
+        pending[asyncio.create_task(waiter)] = provider
+
+    try:
+        for provider in skipped:
+            yield ProviderResult(provider.name, STATUS_CIRCUIT_OPEN)
+
+        while pending:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            done, _ = await asyncio.wait(
+                pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                break
+
+            for task in done:
+                provider = pending.pop(task)
+                measured = provider.name not in followers
+                breaker = breaker_for(provider.name)
+                elapsed = time.monotonic() - started
+                exc = task.exception()
+                if exc is not None:
+                    if measured:
+                        print(f"Provider error ({provider.name}): {exc!r}")
+                        breaker.record_failure(elapsed)
+                        record_call(provider.name, STATUS_ERROR, elapsed)
+                    yield ProviderResult(provider.name, STATUS_ERROR, elapsed=elapsed, error=str(exc))
+                else:
+                    books = task.result() or []
+                    if measured:
+                        breaker.record_success(elapsed)
+                        record_call(provider.name, STATUS_OK, elapsed, len(books))
+                    yield ProviderResult(provider.name, STATUS_OK, books, elapsed)
+
+        elapsed = time.monotonic() - started
+        timed_out = list(pending.values())
+        for task in pending:
+            task.cancel()
+        pending.clear()
+        for provider in timed_out:
+            if provider.name not in followers:
+                breaker = breaker_for(provider.name)
+                if timeout is not None and timeout >= min(provider.timeout, failure_after or provider.timeout):
+                    breaker.record_failure(elapsed)
+                else:
+                    breaker.release_probe()
+                record_call(provider.name, STATUS_TIMEOUT)
+            yield ProviderResult(provider.name, STATUS_TIMEOUT, elapsed=elapsed)
+    finally:
+        # Early close: stragglers are cancelled without counting against them
+        for task, provider in pending.items():
+            task.cancel()
+            if provider.name not in followers:
+                breaker_for(provider.name).release_probe()
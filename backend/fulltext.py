@@ -0,0 +1,85 @@
+import re
+from typing import List
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+import schemas
+
+# External-content FTS5 index over books_cache. unicode61 with
+# remove_diacritics folds accents, so "memorias" matches "Memórias".
+FTS_SETUP = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(
+        title, author, summary,
+        content='books_cache', content_rowid='rowid',
+        tokenize="unicode61 remove_diacritics 2",
+        prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS books_fts_ai AFTER INSERT ON books_cache BEGIN
+        INSERT INTO books_fts(rowid, title, author, summary)
+        VALUES (new.rowid, new.title, new.author, new.summary);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS books_fts_ad AFTER DELETE ON books_cache BEGIN
+        INSERT INTO books_fts(books_fts, rowid, title, author, summary)
+        VALUES ('delete', old.rowid, old.title, old.author, old.summary);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS books_fts_au AFTER UPDATE ON books_cache BEGIN
+        INSERT INTO books_fts(books_fts, rowid, title, author, summary)
+        VALUES ('delete', old.rowid, old.title, old.author, old.summary);
+        INSERT INTO books_fts(rowid, title, author, summary)
+        VALUES (new.rowid, new.title, new.author, new.summary);
+    END
+    """,
+]
+
+# Column weights for bm25(): a title hit counts most, then author, then summary
+BM25_WEIGHTS = "10.0, 5.0, 1.0"
+
+# Shelf rows imported from the Best Books CSV link back to search, not to a
+# readable copy, so they are not useful as search results.
+LOCAL_SEARCH_SQL = f"""
+    SELECT b.id, b.title, b.author, b.language, b.source,
+           b.download_url, b.preview_url, b.cover_url, b.summary
+    FROM books_fts
+    JOIN books_cache AS b ON b.rowid = books_fts.rowid
+    WHERE books_fts MATCH :match AND b.source NOT LIKE 'csv_%'
+    ORDER BY bm25(books_fts, {BM25_WEIGHTS})
+    LIMIT :limit
+"""
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def init_fulltext(engine: Engine) -> None:
+    with engine.begin() as conn:
+        exists = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'books_fts'")
+        ).first()
+        for statement in FTS_SETUP:
+            conn.execute(text(statement))
+        if not exists:
+            # Index whatever was cached before the index existed
+            conn.execute(text("INSERT INTO books_fts(books_fts) VALUES ('rebuild')"))
+
+
+def build_match_query(query: str) -> str:
+    """Turn free text into an FTS5 query: every word must match, as a prefix"""
+    tokens = TOKEN_RE.findall(query)
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+def search_local(db: Session, query: str, limit: int) -> List[schemas.BookDetails]:
+    match = build_match_query(query)
+    if not match:
+        return []
+
+    rows = db.execute(text(LOCAL_SEARCH_SQL), {"match": match, "limit": limit}).mappings()
+    return [schemas.BookDetails(**row) for row in rows]
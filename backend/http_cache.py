@@ -0,0 +1,188 @@
+import gzip
+import hashlib
+import re
+from typing import Dict, List, Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional, gzip always works
+    brotli = None
+
+
+# First matching path pattern wins. Catalog data barely changes, searches
+# are cached for a short while, health and streams never.
+CACHE_POLICIES: List[Tuple[re.Pattern, str]] = [
+    (re.compile(r"^/api/categorias$"), "public, max-age=86400, stale-while-revalidate=3600"),
+    (re.compile(r"^/api/books/[^/]+$"), "public, max-age=86400, stale-while-revalidate=3600"),
+    (re.compile(r"^/api/(destaques|fantasy-destaques)$"), "public, max-age=300, stale-while-revalidate=3600"),
+    (re.compile(r"^/api/search/stream$"), "no-store"),
+    (re.compile(r"^/api/(search|categoria/[^/]+)$"), "public, max-age=60, stale-while-revalidate=300"),
+    (re.compile(r"^/api/providers/health$"), "no-store"),
+    (re.compile(r"^/api/covers/[^/]+$"), "public, max-age=2592000"),
+    (re.compile(r"^/metrics$"), "no-store"),
+]
+
+# Bodies smaller than this aren't worth compressing
+MINIMUM_COMPRESS_SIZE = 512
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# Responses whose body is produced incrementally; never buffered
+STREAMING_TYPES = ("application/x-ndjson", "text/event-stream")
+# Images and other binaries are already compressed
+COMPRESSIBLE_TYPES = ("application/json", "text/")
+
+
+def cache_policy(path: str) -> Optional[str]:
+    for pattern, policy in CACHE_POLICIES:
+        if pattern.match(path):
+            return policy
+    return None
+
+
+def content_etag(body: bytes) -> str:
+    return f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+
+def variant_etag(etag: str, encoding: str) -> str:
+    """Strong ETags must differ per content-coding: "abc" -> "abc-gzip\""""
+    if encoding == "identity":
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison, as RFC 9110 requires for If-None-Match
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag.removeprefix("W/") in candidates
+
+
+def supported_encodings() -> List[str]:
+    return ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+def choose_encoding(accept_encoding: Optional[str], available: List[str]) -> str:
+    """Pick the first of `available` (in server preference order) the client accepts"""
+    if not accept_encoding:
+        return "identity"
+
+    accepted: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        match = re.search(r"q=([0-9.]+)", params)
+        if match:
+            try:
+                q = float(match.group(1))
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+
+    for encoding in available:
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if q > 0:
+            return encoding
+    return "identity"
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    return body
+
+
+class HttpCacheMiddleware:
+    """Cache-Control per route, content-hash ETags with 304s, and gzip/brotli.
+
+    Buffers complete 200 responses to GET/HEAD requests. Streaming
+    responses and responses that already carry a Content-Encoding (the
+    precompressed catalog shelves) only get their Cache-Control header.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = MINIMUM_COMPRESS_SIZE) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] not in ("GET", "HEAD"):
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = Headers(scope=scope)
+        policy = cache_policy(scope["path"])
+        start_message: Optional[Message] = None
+        chunks: List[bytes] = []
+        passthrough = False
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal start_message, passthrough
+
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(raw=message["headers"])
+                # Errors must not be cached with the route's policy
+                if policy and message["status"] in (200, 304) and "cache-control" not in headers:
+                    headers["Cache-Control"] = policy
+                content_type = headers.get("content-type", "")
+                if (
+                    scope["method"] != "GET"
+                    or message["status"] != 200
+                    or "content-encoding" in headers
+                    or content_type.startswith(STREAMING_TYPES)
+                ):
+                    passthrough = True
+                    await send(message)
+                else:
+                    start_message = message
+                return
+
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+
+            assert start_message is not None
+            await self._send_buffered(start_message, b"".join(chunks), request_headers, send)
+
+        await self.app(scope, receive, send_wrapper)
+
+    async def _send_buffered(
+        self, start: Message, body: bytes, request_headers: Headers, send: Send
+    ) -> None:
+        headers = MutableHeaders(raw=start["headers"])
+        etag = headers.get("etag") or content_etag(body)
+
+        encoding = "identity"
+        content_type = headers.get("content-type", "")
+        if len(body) >= self.minimum_size and content_type.startswith(COMPRESSIBLE_TYPES):
+            encoding = choose_encoding(request_headers.get("accept-encoding"), supported_encodings())
+            headers.add_vary_header("Accept-Encoding")
+        etag = variant_etag(etag, encoding)
+        headers["ETag"] = etag
+
+        if etag_matches(request_headers.get("if-none-match"), etag):
+            del headers["content-length"]
+            if "content-type" in headers:
+                del headers["content-type"]
+            await send({"type": "http.response.start", "status": 304, "headers": headers.raw})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        if encoding != "identity":
+            body = compress(body, encoding)
+            headers["Content-Encoding"] = encoding
+        headers["Content-Length"] = str(len(body))
+
+        await send({"type": "http.response.start", "status": start["status"], "headers": headers.raw})
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,66 @@
+from typing import Dict
+from urllib.parse import urlsplit
+
+import httpx
+
+# Per-host connection settings. Hosts that speak HTTP/2 multiplex every
+# provider call over a single warm connection; the rest get a keep-alive pool.
+HOST_SETTINGS: Dict[str, dict] = {
+    "gutendex.com": {"http2": False, "max_connections": 10},
+    "openlibrary.org": {"http2": True, "max_connections": 10},
+    "archive.org": {"http2": True, "max_connections": 10},
+    "annas-archive.li": {"http2": True, "max_connections": 5},
+}
+DEFAULT_HOST_SETTINGS = {"http2": False, "max_connections": 10}
+
+KEEPALIVE_EXPIRY = 60.0
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class HttpClientRegistry:
+    """Owns one pooled AsyncClient per upstream host, shared by every provider."""
+
+    def __init__(self) -> None:
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._http2 = _http2_available()
+        self._closed = False
+
+    def get(self, url: str) -> httpx.AsyncClient:
+        if self._closed:
+            raise RuntimeError("HttpClientRegistry is closed")
+
+        host = urlsplit(url).hostname or url
+        client = self._clients.get(host)
+        if client is None:
+            client = self._create_client(host)
+            self._clients[host] = client
+        return client
+
+    def _create_client(self, host: str) -> httpx.AsyncClient:
+        settings = HOST_SETTINGS.get(host, DEFAULT_HOST_SETTINGS)
+        limits = httpx.Limits(
+            max_connections=settings["max_connections"],
+            max_keepalive_connections=settings["max_connections"],
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        )
+        return httpx.AsyncClient(
+            limits=limits,
+            http2=settings["http2"] and self._http2,
+        )
+
+    async def aclose(self) -> None:
+        self._closed = True
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            try:
+                await client.aclose()
+            except Exception as e:
+                print(f"Error closing http client: {e}")
+
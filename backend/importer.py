@@ -0,0 +1,215 @@
+"""Import homepage shelves from the Best Books Ever CSV.
+
+Reads the CSV once, fills every shelf definition in the same pass, upserts
+the books into books_cache in one transaction and writes the
+preloaded_books.json snapshot the API serves the shelves from.
+
+    python importer.py books_1.Best_Books_Ever.csv
+    python importer.py books.csv --db books.db --shelves shelves.json
+"""
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import sys
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from sqlalchemy import create_engine
+
+import models
+from catalog import PRELOADED_BOOKS_PATH
+
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "books.db")
+PORTUGUESE = ["portuguese", "pt", "pt-br"]
+
+# Rows per executemany
+CHUNK_SIZE = 1000
+
+BOOK_COLUMNS = ["id", "title", "author", "language", "source", "download_url", "preview_url", "cover_url", "summary"]
+
+UPSERT_SQL = f"""
+    INSERT INTO books_cache ({", ".join(BOOK_COLUMNS)}, created_at)
+    VALUES ({", ".join("?" for _ in BOOK_COLUMNS)}, ?)
+    ON CONFLICT(id) DO UPDATE SET {", ".join(f"{c} = excluded.{c}" for c in BOOK_COLUMNS[1:])}
+"""
+
+
+class ShelfDefinition:
+    """Which CSV rows go on a shelf: language and genre predicates, and a cap"""
+
+    def __init__(
+        self,
+        name: str,
+        id_prefix: str,
+        source: str,
+        limit: int = 30,
+        languages: Sequence[str] = PORTUGUESE,
+        genres: Sequence[str] = (),
+    ) -> None:
+        self.name = name
+        self.id_prefix = id_prefix
+        self.source = source
+        self.limit = limit
+        self.languages = {language.lower() for language in languages}
+        self.genres = [genre.lower() for genre in genres]
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ShelfDefinition":
+        return cls(
+            name=data["name"],
+            id_prefix=data["id_prefix"],
+            source=data["source"],
+            limit=int(data.get("limit", 30)),
+            languages=data.get("languages", PORTUGUESE),
+            genres=data.get("genres", ()),
+        )
+
+    def matches(self, language: str, genres: str) -> bool:
+        if self.languages and language not in self.languages:
+            return False
+        return not self.genres or any(genre in genres for genre in self.genres)
+
+
+SHELVES = [
+    ShelfDefinition("destaques", "CSV_DESTAQUE_", "csv_destaques"),
+    ShelfDefinition("fantasy", "CSV_FANTASY_", "csv_best_books", genres=["fantasy"]),
+]
+
+
+def load_shelves(path: str) -> List[ShelfDefinition]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [ShelfDefinition.from_dict(item) for item in json.load(f)]
+
+
+def scan_csv(path: str, shelves: Sequence[ShelfDefinition]) -> Dict[str, List[dict]]:
+    """Fill every shelf from one pass over the CSV, stopping once all are full"""
+    filled: Dict[str, List[dict]] = {shelf.name: [] for shelf in shelves}
+    open_shelves = [shelf for shelf in shelves if shelf.limit > 0]
+
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        column = {name: index for index, name in enumerate(header)}
+
+        def field(row: List[str], name: str) -> str:
+            index = column.get(name)
+            return row[index] if index is not None and index < len(row) else ""
+
+        for row in reader:
+            if not open_shelves:
+                break
+
+            cover = field(row, "coverImg")
+            if not cover or cover == "NaN" or "http" not in cover:
+                continue
+            language = field(row, "language").lower()
+            genres = field(row, "genres").lower()
+            matching = [shelf for shelf in open_shelves if shelf.matches(language, genres)]
+            if not matching:
+                continue
+
+            title = field(row, "title")
+            book_id = field(row, "bookId") or str(uuid.uuid4())
+            for shelf in matching:
+                filled[shelf.name].append({
+                    "id": f"{shelf.id_prefix}{book_id}",
+                    "title": title,
+                    "author": field(row, "author"),
+                    "language": "pt",
+                    "source": shelf.source,
+                    # Links back to search so the providers handle the download
+                    "download_url": f"/?q={title}",
+                    "preview_url": f"/?q={title}",
+                    "cover_url": cover,
+                    "summary": field(row, "description"),
+                })
+                if len(filled[shelf.name]) >= shelf.limit:
+                    open_shelves.remove(shelf)
+
+    return filled
+
+
+def chunks(items: List[tuple], size: int) -> Iterable[List[tuple]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def write_db(db_path: str, shelves: Sequence[ShelfDefinition], filled: Dict[str, List[dict]], chunk_size: int = CHUNK_SIZE) -> None:
+    # Creates books_cache on a fresh database
+    models.Base.metadata.create_all(bind=create_engine(f"sqlite:///{db_path}"))
+
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.execute("PRAGMA recursive_triggers=ON")
+        now = datetime.utcnow()
+        rows = [
+            tuple(book[c] for c in BOOK_COLUMNS) + (now,)
+            for shelf in shelves
+            for book in filled[shelf.name]
+        ]
+        # One transaction: if an upsert fails (say the API holds the lock past
+        # busy_timeout), the shelves keep their old books instead of none.
+        # IMMEDIATE takes the write lock before the first delete.
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            # Books dropped from a shelf since the last import go away
+            for shelf in shelves:
+                if filled[shelf.name]:
+                    conn.execute("DELETE FROM books_cache WHERE id LIKE ?", (shelf.id_prefix + "%",))
+            for chunk in chunks(rows, chunk_size):
+                conn.executemany(UPSERT_SQL, chunk)
+    finally:
+        conn.close()
+
+
+def write_snapshot(json_path: str, filled: Dict[str, List[dict]]) -> None:
+    # Shelves not part of this import keep their current contents
+    data: Dict[str, List[dict]] = {}
+    if os.path.exists(json_path):
+        with open(json_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    data.update({name: books for name, books in filled.items() if books})
+
+    # Written aside and swapped in, so the API never reloads a half-written file
+    tmp_path = json_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, json_path)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Import homepage shelves from the Best Books Ever CSV")
+    parser.add_argument("csv", help="path to books_1.Best_Books_Ever.csv")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help="SQLite database to upsert into")
+    parser.add_argument("--json", default=PRELOADED_BOOKS_PATH, help="snapshot the API loads the shelves from")
+    parser.add_argument("--shelves", help="JSON file with a list of shelf definitions (default: destaques and fantasy)")
+    parser.add_argument("--no-db", action="store_true", help="only write the JSON snapshot")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    shelves = load_shelves(args.shelves) if args.shelves else SHELVES
+    started = time.perf_counter()
+
+    try:
+        filled = scan_csv(args.csv, shelves)
+    except (OSError, csv.Error, UnicodeDecodeError) as e:
+        print(f"Error reading {args.csv}: {e}")
+        return 1
+    for shelf in shelves:
+        print(f"{shelf.name}: {len(filled[shelf.name])} books")
+
+    if not args.no_db:
+        write_db(args.db, shelves, filled, args.chunk_size)
+    write_snapshot(args.json, filled)
+
+    print(f"Imported {sum(map(len, filled.values()))} books in {time.perf_counter() - started:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+import asyncio
+import os
+from typing import Awaitable, Callable, Optional
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+    import msvcrt
+
+# Lock files live next to books.db, which is also opened relative to the cwd
+LOCK_DIR = os.getenv("LOCK_DIR", ".")
+# How often a process that lost an election checks whether the leader is gone
+LEADER_RETRY_SECONDS = 15.0
+
+
+def lock_path(name: str) -> str:
+    return os.path.join(LOCK_DIR, f"{name}.lock")
+
+
+class FileLock:
+    """Exclusive advisory lock on a file, shared by every process on the host.
+
+    The OS drops it when the holding process exits, crashes included, so a
+    dead leader never leaves a stale lock behind.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._fd: Optional[int] = None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        if self._fd is not None:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            else:
+                msvcrt.locking(fd, msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+        except OSError:
+            os.close(fd)
+            if blocking:
+                raise
+            return False
+        self._fd = fd
+        return True
+
+    def release(self) -> None:
+        if self._fd is None:
+            return
+        fd, self._fd = self._fd, None
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(fd)
+
+    def __enter__(self) -> "FileLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.release()
+
+
+async def run_as_leader(
+    name: str, fn: Callable[[], Awaitable[None]], retry_seconds: float = LEADER_RETRY_SECONDS
+) -> None:
+    """Run `fn` in exactly one process per host: whichever holds the `name`
+    lock. The others keep trying, so one takes over if the leader exits.
+    """
+    lock = FileLock(lock_path(name))
+    announced = False
+    while not lock.acquire(blocking=False):
+        if not announced:
+            print(f"Another process is running '{name}'; standing by")
+            announced = True
+        await asyncio.sleep(retry_seconds)
+    try:
+        await fn()
+    finally:
+        lock.release()
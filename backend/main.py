@@ -1,37 +1,115 @@
 import asyncio
-from typing import List, Any
+import os
+from typing import AsyncIterator, Dict, List, Optional
 
-from fastapi import FastAPI, Depends, HTTPException, Query
+import httpx
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 
+import metrics
 import models
 import schemas
-from database import engine, get_db
+from covers import CoverStore, cover_allowed, create_cover_client, fetch_cover, get_cover
+from crud import get_cover_url, seed_categories
+from database import get_db, run_db
+from catalog import PreloadedCatalog
+from circuit_breaker import breaker_for
+from fanout import (
+    ProviderResult,
+    STATUS_CIRCUIT_OPEN,
+    STATUS_ERROR,
+    STATUS_OK,
+    STATUS_TIMEOUT,
+    iter_provider_results,
+    latency_for,
+)
+from fulltext import search_local
+from http_cache import HttpCacheMiddleware, choose_encoding, etag_matches
+from leader import FileLock, lock_path, run_as_leader
+from pagination import Cursor
+from responses import FastResponse, book_payload, books_payload, dumps_json
+from scheduler import Scheduler
+from search_cache import CacheEntry, make_key
+from search_service import (
+    CATEGORY_LIMIT,
+    DEFAULT_BUDGET_SECONDS,
+    DEFAULT_SEARCH_LIMIT,
+    HEDGE_REQUESTS,
+    MAX_SEARCH_LIMIT,
+    WARM_INTERVAL_SECONDS,
+    category_query,
+    combine_results,
+    find_book,
+    lookup_cache,
+    provider_names,
+    providers,
+    recent_books,
+    remember_results,
+    resolve_budget,
+    schedule_refresh,
+    search_page,
+    shared_cache,
+    start_services,
+    stop_services,
+    warm_categories,
+    warm_popular_queries,
+)
+from upstream import upstream_scheduler
+
+# auto: one process per host runs the Telegram bot, whichever API worker
+# wins the bot lock (so `uvicorn --workers N` polls once). off: the API
+# never does; run `python bot.py` on its own, or go without the bot.
+BOT_MODE = os.getenv("BOT_MODE", "auto")
 
-from providers.gutenberg import GutenbergProvider
-from providers.openlibrary import OpenLibraryProvider
-from providers.internetarchive import InternetArchiveProvider
-from providers.annasarchive import AnnasArchiveProvider
+# Categories are the same for every worker; the first to take this lock warms them
+warm_lock = FileLock(lock_path("warm"))
 
-# We need threading to run bot polling concurrently with FastAPI
-import threading
-from bot import run_bot
 
-models.Base.metadata.create_all(bind=engine)
+async def warm_shared_categories() -> None:
+    if warm_lock.acquire(blocking=False):
+        await warm_categories()
 
 from contextlib import asynccontextmanager
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # This runs when FastAPI starts
-    bot_thread = threading.Thread(target=run_bot, daemon=True)
-    bot_thread.start()
+    http_clients = await start_services()
+    app.state.http_clients = http_clients
+    app.state.cover_client = create_cover_client()
+    scheduler = Scheduler()
+    scheduler.every(WARM_INTERVAL_SECONDS, warm_shared_categories, initial_delay=5.0)
+    scheduler.every(WARM_INTERVAL_SECONDS, warm_popular_queries)
+    scheduler.start()
+
+    bot_task = None
+    if BOT_MODE == "auto":
+        # The bot polls on the same event loop, sharing providers and the search cache
+        from bot import TELEGRAM_BOT_TOKEN, run_bot
+
+        if TELEGRAM_BOT_TOKEN:
+            bot_task = asyncio.create_task(run_as_leader("bot", run_bot))
+        else:
+            print("TELEGRAM_BOT_TOKEN not found in environment variables; the Telegram bot is disabled")
     yield
-    # This runs when FastAPI stops (shutdown logic if needed)
+    # This runs when FastAPI stops
+    if bot_task is not None:
+        bot_task.cancel()
+        try:
+            await bot_task
+        except asyncio.CancelledError:
+            pass
+    await scheduler.stop()
+    await app.state.cover_client.aclose()
+    await stop_services(http_clients)
 
 app = FastAPI(title="Open Books Search Engine API", lifespan=lifespan)
 
+# Cache-Control, ETags and compression for every route
+app.add_middleware(HttpCacheMiddleware)
+
 # Add CORS middleware to allow frontend requests
 app.add_middleware(
     CORSMiddleware,
@@ -39,9 +117,16 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Provider-Status"],
 )
 
-providers = [AnnasArchiveProvider(), GutenbergProvider(), OpenLibraryProvider(), InternetArchiveProvider()]
+# Outermost, so request timings include the other middleware
+app.add_middleware(metrics.MetricsMiddleware)
+
+catalog = PreloadedCatalog()
+cover_store = CoverStore()
+
+SEARCH_MODES = "^(remote|local|local_first)$"
 
 
 @app.get("/")
@@ -49,74 +134,149 @@ def read_root() -> dict:
     return {"message": "Welcome to the Open Books Search Engine API!"}
 
 
+def format_status(statuses: Dict[str, str]) -> str:
+    return ", ".join(f"{name}={status}" for name, status in statuses.items())
+
+
+def parse_cursor(cursor: Optional[str], limit: int) -> Optional[Cursor]:
+    if cursor is None:
+        return None
+    try:
+        return Cursor.decode(cursor, provider_names, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {e}")
+
+
+def page_headers(statuses: Dict[str, str], cursor: Optional[Cursor] = None) -> Dict[str, str]:
+    headers = {"X-Provider-Status": format_status(statuses)}
+    if cursor is not None:
+        headers["X-Next-Cursor"] = cursor.encode()
+    return headers
+
+
 @app.get("/api/search", response_model=List[schemas.BookDetails])
 async def search_books(
-    query: str, limit: int = 60, db: Session = Depends(get_db)
-) -> Any:
-    # 1. Very simple cache check: if we already searched this query, we might have it stored.
-    # For now, let's keep it simple: we fetch from providers and upsert to cache.
-    # Real cache logic should be more robust, potentially a separate SearchCache table.
-
-    tasks = [provider.search(query, limit) for provider in providers]
-    provider_results = await asyncio.gather(*tasks, return_exceptions=True)
-
-    all_books: List[schemas.BookDetails] = []
-
-    for res in provider_results:
-        if isinstance(res, Exception):
-            print(f"Provider error: {res}")
-            continue
-        if isinstance(res, list):
-            all_books.extend(res)
-
-    final_books = all_books[:limit]
-
-    # Save to SQLite cache
-    for book in final_books:
-        existing = (
-            db.query(models.BookCache).filter(models.BookCache.id == book.id).first()
+    query: str,
+    request: Request,
+    limit: int = Query(DEFAULT_SEARCH_LIMIT, gt=0, le=MAX_SEARCH_LIMIT),
+    budget: Optional[float] = Query(None, gt=0, description="Latency budget in seconds"),
+    mode: str = Query("remote", pattern=SEARCH_MODES, description="remote, local or local_first"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page"),
+) -> Response:
+    next_cursor = None
+    if mode == "local":
+        books, statuses = await run_db(search_local, query, limit), {"local": STATUS_OK}
+    else:
+        books, statuses, next_cursor = await search_page(
+            query, limit, parse_cursor(cursor, limit), budget, local_first=mode == "local_first"
         )
-        if not existing:
-            new_book = models.BookCache(
-                id=book.id,
-                title=book.title,
-                author=book.author,
-                language=book.language,
-                source=book.source,
-                download_url=book.download_url,
-                preview_url=book.preview_url,
-                cover_url=book.cover_url,
-                summary=book.summary,
-            )
-            db.add(new_book)
-        else:
-            # Update fields
-            existing.title = book.title  # type: ignore[assignment]
-            existing.cover_url = book.cover_url  # type: ignore[assignment]
-
-    db.commit()
-
-    return final_books
+    return FastResponse(books_payload(books), request, headers=page_headers(statuses, next_cursor))
+
+
+def ndjson_line(payload: dict) -> bytes:
+    return dumps_json(payload) + b"\n"
+
+
+async def stream_cached(entry: CacheEntry, limit: int) -> AsyncIterator[bytes]:
+    books = entry.books[:limit]
+    yield ndjson_line({
+        "type": "batch",
+        "provider": "cache",
+        "books": books_payload(books),
+    })
+    # The providers that were missing when the cached answer was fetched
+    statuses = entry.statuses
+    yield ndjson_line({
+        "type": "summary",
+        "cached": True,
+        "timed_out": [name for name, status in statuses.items() if status == STATUS_TIMEOUT],
+        "failed": [name for name, status in statuses.items() if status == STATUS_ERROR],
+        "skipped": [name for name, status in statuses.items() if status == STATUS_CIRCUIT_OPEN],
+        "count": len(books),
+    })
+
+
+async def stream_providers(
+    key: str, query: str, limit: int, budget: Optional[float]
+) -> AsyncIterator[bytes]:
+    results: List[ProviderResult] = []
+    async for result in iter_provider_results(
+        providers, query, limit, timeout=resolve_budget(budget), hedge=HEDGE_REQUESTS,
+        failure_after=DEFAULT_BUDGET_SECONDS,
+    ):
+        results.append(result)
+        if result.status == STATUS_OK:
+            yield ndjson_line({
+                "type": "batch",
+                "provider": result.provider,
+                "elapsed": round(result.elapsed, 3),
+                "books": books_payload(result.books),
+            })
+
+    books = combine_results(query, results)
+    statuses = {result.provider: result.status for result in results}
+    if books:
+        remember_results(key, query, books, statuses)
+
+    yield ndjson_line({
+        "type": "summary",
+        "cached": False,
+        "timed_out": [r.provider for r in results if r.status == STATUS_TIMEOUT],
+        "failed": [r.provider for r in results if r.status == STATUS_ERROR],
+        "skipped": [r.provider for r in results if r.status == STATUS_CIRCUIT_OPEN],
+        "count": min(len(books), limit),
+    })
+
+
+@app.get("/api/search/stream")
+async def search_books_stream(
+    query: str,
+    limit: int = Query(DEFAULT_SEARCH_LIMIT, gt=0, le=MAX_SEARCH_LIMIT),
+    budget: Optional[float] = Query(None, gt=0, description="Latency budget in seconds"),
+) -> StreamingResponse:
+    """NDJSON stream: one "batch" line per provider as it answers, then a "summary" line"""
+    key = make_key(query, limit, provider_names)
+
+    entry = await lookup_cache(key)
+    if entry is not None:
+        if not entry.is_fresh():
+            schedule_refresh(key, query, limit)
+        body = stream_cached(entry, limit)
+    else:
+        body = stream_providers(key, query, limit, budget)
+
+    return StreamingResponse(body, media_type="application/x-ndjson")
+
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics() -> Response:
+    """Prometheus text exposition of the in-process metrics"""
+    return Response(content=metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.get("/api/providers/health", response_model=schemas.ProviderHealthList)
+def get_providers_health() -> dict:
+    health = []
+    for provider in providers:
+        snapshot = breaker_for(provider.name).snapshot()
+        snapshot["p95_latency"] = latency_for(provider).percentile(0.95)
+        health.append(snapshot)
+    return {"providers": health, "upstream": upstream_scheduler.snapshot()}
 
 
 @app.get("/api/books/{book_id}", response_model=schemas.BookDetails)
-def get_book_details(book_id: str, db: Session = Depends(get_db)) -> Any:
-    book = db.query(models.BookCache).filter(models.BookCache.id == book_id).first()
+async def get_book_details(book_id: str, request: Request) -> Response:
+    book = await find_book(book_id)
     if not book:
         raise HTTPException(status_code=404, detail="Book not found in cache")
-    return book
+    return FastResponse(book_payload(book), request)
 
 
 @app.get("/api/categorias", response_model=schemas.CategoryList)
 def get_categorias(db: Session = Depends(get_db)) -> dict:
     categories = db.query(models.Category).all()
     if not categories:
-        default_categories = [
-            models.Category(nome="Fantasia", cor="#8b5cf6", adulto=False),
-            models.Category(nome="Dark", cor="#1f2937", adulto=True),
-            models.Category(nome="Estudo", cor="#3b82f6", adulto=False)
-        ]
-        db.add_all(default_categories)
+        seed_categories(db)
         db.commit()
         categories = db.query(models.Category).all()
 
@@ -125,75 +285,95 @@ def get_categorias(db: Session = Depends(get_db)) -> dict:
 
 @app.get("/api/categoria/{nome}", response_model=List[schemas.BookDetails])
 async def search_books_by_category(
-    nome: str, db: Session = Depends(get_db)
-) -> Any:
-    # Fetch up to 100 books for this category. We re-use the providers.
-    query = f"subject:{nome}" if "openlibrary" in [p.__class__.__name__.lower() for p in providers] else nome
-    limit = 100
-    
-    tasks = [provider.search(query, limit) for provider in providers]
-    provider_results = await asyncio.gather(*tasks, return_exceptions=True)
-
-    all_books: List[schemas.BookDetails] = []
-
-    for res in provider_results:
-        if isinstance(res, Exception):
-            print(f"Provider error: {res}")
-            continue
-        if isinstance(res, list):
-            all_books.extend(res)
-
-    final_books = all_books[:limit]
-
-    # Save to SQLite cache
-    for book in final_books:
-        existing = (
-            db.query(models.BookCache).filter(models.BookCache.id == book.id).first()
-        )
-        if not existing:
-            new_book = models.BookCache(
-                id=book.id,
-                title=book.title,
-                author=book.author,
-                language=book.language,
-                source=book.source,
-                download_url=book.download_url,
-                preview_url=book.preview_url,
-                cover_url=book.cover_url,
-                summary=book.summary,
-            )
-            db.add(new_book)
-        else:
-            existing.title = book.title  # type: ignore[assignment]
-            existing.cover_url = book.cover_url  # type: ignore[assignment]
-
-    db.commit()
+    nome: str,
+    request: Request,
+    limit: int = Query(CATEGORY_LIMIT, gt=0, le=CATEGORY_LIMIT),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page"),
+) -> Response:
+    # Fetch a page of books for this category; kept warm by the scheduler
+    query = category_query(nome)
+
+    books, statuses, next_cursor = await search_page(query, limit, parse_cursor(cursor, limit))
+    return FastResponse(books_payload(books), request, headers=page_headers(statuses, next_cursor))
+
+
+async def fetch_cover_bytes(url: str) -> bytes:
+    cover_client = getattr(app.state, "cover_client", None)
+    if cover_client is not None:
+        return await fetch_cover(cover_client, url)
+    async with create_cover_client() as client:
+        return await fetch_cover(client, url)
+
+
+async def find_cover_url(book_id: str) -> Optional[str]:
+    # Just returned by a search, and maybe not in books_cache yet
+    book = recent_books.get(book_id)
+    if book is not None:
+        return book.cover_url
+    url = await run_db(get_cover_url, book_id)
+    if not url:
+        # Fetched by another node, or one of the homepage shelves
+        book = await find_book(book_id) if shared_cache is not None else None
+        book = book or catalog.find_book(book_id)
+        url = book.cover_url if book else None
+    return url
+
+
+@app.get("/api/covers/{book_id}")
+async def get_cover_image(
+    book_id: str,
+    request: Request,
+    size: str = Query("card", pattern="^(card|detail)$"),
+    format: Optional[str] = Query(None, pattern="^(webp|jpeg)$"),
+) -> Response:
+    """Cover proxy: fetched once, cached on disk, served resized"""
+    url = await find_cover_url(book_id)
+    if not url or not cover_allowed(url):
+        raise HTTPException(status_code=404, detail="Cover not found")
+
+    fmt = format or ("webp" if "image/webp" in request.headers.get("accept", "") else "jpeg")
+
+    # A second attempt covers the original being evicted mid-request
+    for attempt in range(2):
+        try:
+            body, media_type, etag = await get_cover(cover_store, url, size, fmt, fetch_cover_bytes)
+            break
+        except LookupError:
+            if attempt:
+                raise HTTPException(status_code=503, detail="Cover cache busy, try again")
+        except (httpx.HTTPError, ValueError, OSError) as e:
+            print(f"Cover fetch error for {book_id}: {e}")
+            raise HTTPException(status_code=502, detail="Could not fetch cover")
+
+    headers = {"ETag": etag}
+    if format is None:
+        headers["Vary"] = "Accept"
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
+def shelf_response(request: Request, name: str) -> Response:
+    shelf = catalog.shelf(name)
+    encoding = choose_encoding(request.headers.get("accept-encoding"), list(shelf.variants))
+    body, etag = shelf.variants[encoding]
+
+    headers = {"ETag": etag, "Vary": "Accept-Encoding"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
 
-    return all_books
-
-
-import json
-import os
-
-PRELOADED_BOOKS_PATH = os.path.join(os.path.dirname(__file__), "preloaded_books.json")
-
-def load_preloaded_books():
-    try:
-        with open(PRELOADED_BOOKS_PATH, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"Error loading preloaded books: {e}")
-        return {"destaques": [], "fantasy": []}
 
 @app.get("/api/destaques", response_model=List[schemas.BookDetails])
-def get_destaques(db: Session = Depends(get_db)) -> Any:
-    data = load_preloaded_books()
-    return data.get("destaques", [])[:12]
+async def get_destaques(request: Request) -> Response:
+    return shelf_response(request, "destaques")
+
 
 @app.get("/api/fantasy-destaques", response_model=List[schemas.BookDetails])
-def get_fantasy_destaques(db: Session = Depends(get_db)) -> Any:
-    data = load_preloaded_books()
-    return data.get("fantasy", [])[:30]
+async def get_fantasy_destaques(request: Request) -> Response:
+    return shelf_response(request, "fantasy")
 
 
 if __name__ == "__main__":
@@ -25,3 +25,16 @@ class Category(Base):
     nome = Column(String, index=True, unique=True)
     cor = Column(String, nullable=True)
     adulto = Column(Boolean, default=False)
+
+
+class SearchCache(Base):
+    __tablename__ = "search_cache"
+
+    key = Column(String, primary_key=True, index=True)
+    query = Column(String, index=True)
+    providers = Column(String)
+    book_ids = Column(Text)  # JSON list of books_cache ids, in result order
+    created_at = Column(DateTime, default=datetime.utcnow)
+    fresh_until = Column(DateTime, index=True)
+    stale_until = Column(DateTime, index=True)
+    statuses = Column(Text)  # JSON object: provider -> status of its call
@@ -0,0 +1,70 @@
+import base64
+import binascii
+import json
+from typing import Collection, Dict, Mapping
+
+# Bounds on what a client-supplied cursor may ask for
+MAX_PAGE = 100
+MAX_OFFSET = 10000
+
+
+class Cursor:
+    """Position in a paginated search: the page to ask each provider for and
+    how far into the merged results of those pages the client has read.
+
+    Some providers page in units of `limit`, so a cursor only continues the
+    search with the page size it was issued for.
+
+    Serialized as opaque URL-safe base64 JSON.
+    """
+
+    def __init__(self, pages: Mapping[str, int], limit: int, offset: int = 0) -> None:
+        self.pages: Dict[str, int] = dict(pages)
+        self.limit = limit
+        self.offset = offset
+
+    @classmethod
+    def start(cls, provider_names: Collection[str], limit: int) -> "Cursor":
+        return cls({name: 1 for name in provider_names}, limit)
+
+    def is_start(self) -> bool:
+        return self.offset == 0 and all(page == 1 for page in self.pages.values())
+
+    def advanced(self, count: int) -> "Cursor":
+        return Cursor(self.pages, self.limit, self.offset + count)
+
+    def next_round(self, answered: Collection[str]) -> "Cursor":
+        # Providers that failed or timed out are asked for the same page again
+        pages = {name: page + 1 if name in answered else page for name, page in self.pages.items()}
+        return Cursor(pages, self.limit)
+
+    def encode(self) -> str:
+        payload = json.dumps({"p": self.pages, "l": self.limit, "o": self.offset}, separators=(",", ":"), sort_keys=True)
+        return base64.urlsafe_b64encode(payload.encode("utf-8")).rstrip(b"=").decode("ascii")
+
+    @classmethod
+    def decode(cls, token: str, provider_names: Collection[str], limit: int) -> "Cursor":
+        """Parse a cursor, raising ValueError if it is malformed, out of bounds
+        or was issued for another `limit`
+        """
+        try:
+            raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+            data = json.loads(raw)
+        except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError) as e:
+            raise ValueError("malformed cursor") from e
+
+        if not isinstance(data, dict):
+            raise ValueError("malformed cursor")
+        pages, offset, cursor_limit = data.get("p"), data.get("o"), data.get("l")
+        if not isinstance(pages, dict) or not pages or not isinstance(offset, int) or not isinstance(cursor_limit, int):
+            raise ValueError("malformed cursor")
+        if cursor_limit != limit:
+            raise ValueError(f"cursor was issued for limit={cursor_limit}")
+        if not 0 <= offset <= MAX_OFFSET:
+            raise ValueError("cursor offset out of range")
+        for name, page in pages.items():
+            if name not in provider_names:
+                raise ValueError(f"unknown provider in cursor: {name}")
+            if not isinstance(page, int) or not 1 <= page <= MAX_PAGE:
+                raise ValueError("cursor page out of range")
+        return cls(pages, limit, offset)
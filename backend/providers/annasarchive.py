@@ -1,95 +1,196 @@
-import httpx
-from typing import List
+import asyncio
+import os
+from typing import Iterable, Iterator, List, Optional, Tuple
 from bs4 import BeautifulSoup
 import schemas
 from .base import BookProvider
 
+try:
+    import lxml.html
+except ImportError:  # pragma: no cover - lxml is optional, bs4 is the fallback
+    lxml = None
+
+
+# Overridable so benchmarks can point at a local stand-in
+ANNAS_ARCHIVE_URL = os.getenv("ANNAS_ARCHIVE_URL", "https://annas-archive.li")
+
+# A results page is ~0.7 MB of HTML
+MAX_PAGE_BYTES = 4 * 1024 * 1024
+
+# (md5, cover_url, card texts) for one search result card
+Card = Tuple[str, Optional[str], List[str]]
+
+
 class AnnasArchiveProvider(BookProvider):
-    async def search(self, query: str, limit: int = 20) -> List[schemas.BookDetails]:
-        url = "https://annas-archive.li/search"
+    name = "annasarchive"
+    timeout = 30.0
+
+    async def search(self, query: str, limit: int = 20, page: int = 1) -> List[schemas.BookDetails]:
+        url = f"{ANNAS_ARCHIVE_URL}/search"
         params = {"q": query}
-        
+        if page > 1:
+            params["page"] = str(page)
+
         headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
         }
 
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.get(url, params=params, headers=headers, timeout=30.0, follow_redirects=True)
-                response.raise_for_status()
-                html = response.text
-            except Exception as e:
-                print(f"AnnasArchive scraping error: {e}")
-                return []
-
-        soup = BeautifulSoup(html, "html.parser")
-        links = soup.select('a[href^="/md5/"]')
-        
-        results = []
-        seen_md5s = set()
-        
-        for link in links:
-            if len(results) >= limit:
+        body = await self.get_body(
+            url, MAX_PAGE_BYTES, params=params, headers=headers, timeout=self.timeout, follow_redirects=True
+        )
+        html = body.decode("utf-8", errors="replace")
+
+        # Parsing a results page takes tens of milliseconds; keep it off the event loop.
+        # The whole page is kept, whatever `limit`: pages are a fixed size,
+        # so cutting one short would skip the rest when paging.
+        return await asyncio.to_thread(parse_results, html)
+
+
+def parse_results(html: str, limit: Optional[int] = None, parser: Optional[str] = None) -> List[schemas.BookDetails]:
+    """Extract books from a search results page, at most `limit` of them.
+
+    Uses lxml when installed and BeautifulSoup otherwise; pass `parser`
+    ("lxml" or "bs4") to force one.
+    """
+    if parser is None:
+        parser = "lxml" if lxml is not None else "bs4"
+    cards = _iter_cards_lxml(html) if parser == "lxml" else _iter_cards_bs4(html)
+    return _build_books(cards, limit)
+
+
+def _results_fragment(html: str) -> str:
+    # Result cards all sit after the first /md5/ link; skipping the header,
+    # inline scripts and styles before it roughly halves the parse work.
+    first = html.find('href="/md5/')
+    if first == -1:
+        return ""
+    start = html.rfind("<div", 0, first)
+    start = html.rfind("<div", 0, start) if start > 0 else start
+    return html[max(start, 0):]
+
+
+def _iter_cards_lxml(html: str) -> Iterator[Card]:
+    fragment = _results_fragment(html)
+    if not fragment:
+        return
+    root = lxml.html.fragment_fromstring(fragment, create_parent="div")
+
+    for link in root.iterfind('.//a[@href]'):
+        href = link.get("href", "")
+        if not href.startswith("/md5/"):
+            continue
+
+        # Same container lookup as the bs4 path: the card's "mb-4" div,
+        # else the nearest flex div, else the link's parent
+        container = None
+        fallback = None
+        for ancestor in link.iterancestors("div"):
+            classes = ancestor.get("class", "").split()
+            if any("mb-4" in c for c in classes):
+                container = ancestor
                 break
-                
-            href = link.get('href', '')
-            md5 = href.split('/')[-1]
-            if md5 in seen_md5s:
-                continue
-            
-            # Finding the full book card container because html.parser breaks on nested <a> tags
-            container = link.find_parent('div', class_=lambda c: c and 'mb-4' in c)
-            if not container:
-                container = link.find_parent('div', class_=lambda c: c and 'flex' in c) or link.parent
-            
-            # Finding cover image
-            img = container.find('img')
-            cover_url = img.get('src') if img else None
-            
-            # Grab all texts in the container
-            texts = [t.strip() for t in container.stripped_strings if t.strip()]
-            
-            # Filter out UI elements and metadata
-            valid_texts = []
-            for t in texts:
-                t_lower = t.lower()
-                if 'base score' in t_lower or t == 'Save' or 'mb ·' in t_lower or 'read more…' in t_lower or t.startswith('✅') or t.startswith('🚀') or 'english [' in t_lower or 'portuguese [' in t_lower:
-                    continue
-                valid_texts.append(t)
-                
-            if not valid_texts:
-                continue
-                
-            # If the first text is a raw filename or path, skip it
-            first_text = valid_texts[0].lower()
-            if 'upload/' in first_text or 'lgli/' in first_text or first_text.endswith(('.epub', '.pdf', '.mobi', '.azw3', '.lit', '.txt')):
-                valid_texts = valid_texts[1:]
-                
-            if not valid_texts:
-                continue
-                
-            title = valid_texts[0]
-            author = valid_texts[1][:100] if len(valid_texts) > 1 else "Unknown Author"
-            
-            seen_md5s.add(md5)
-            
-            summary_str = " | ".join(valid_texts[:4]) if valid_texts else "Disponível no Anna's Archive."
-            if len(summary_str) > 200:
-                summary_str = summary_str[:197] + "..."
-
-            detail_url = f"https://annas-archive.gl/md5/{md5}"
-            
-            book = schemas.BookDetails(
-                id=f"aa_{md5}",
-                title=title,
-                author=author,
-                language="pt", 
-                source="Annas Archive",
-                download_url=detail_url,
-                preview_url=detail_url,
-                cover_url=cover_url,
-                summary=summary_str,
-            )
-            results.append(book)
-
-        return results
+            if fallback is None and any("flex" in c for c in classes):
+                fallback = ancestor
+        if container is None:
+            container = fallback if fallback is not None else link.getparent()
+
+        img = next(container.iter("img"), None)
+        cover_url = img.get("src") if img is not None else None
+        yield href.split("/")[-1], cover_url, _element_texts(container)
+
+
+def _element_texts(container) -> List[str]:
+    # Like bs4's stripped_strings: visible text in document order, skipping
+    # script/style contents and comments
+    texts: List[str] = []
+
+    def walk(el) -> None:
+        if isinstance(el.tag, str) and el.tag not in ("script", "style"):
+            if el.text and el.text.strip():
+                texts.append(el.text.strip())
+            for child in el:
+                walk(child)
+                if child.tail and child.tail.strip():
+                    texts.append(child.tail.strip())
+
+    walk(container)
+    return texts
+
+
+def _iter_cards_bs4(html: str) -> Iterator[Card]:
+    soup = BeautifulSoup(html, "html.parser")
+    links = soup.select('a[href^="/md5/"]')
+
+    for link in links:
+        href = link.get('href', '')
+
+        # Finding the full book card container because html.parser breaks on nested <a> tags
+        container = link.find_parent('div', class_=lambda c: c and 'mb-4' in c)
+        if not container:
+            container = link.find_parent('div', class_=lambda c: c and 'flex' in c) or link.parent
+
+        # Finding cover image
+        img = container.find('img')
+        cover_url = img.get('src') if img else None
+
+        # Grab all texts in the container
+        texts = [t.strip() for t in container.stripped_strings if t.strip()]
+        yield href.split('/')[-1], cover_url, texts
+
+
+def _is_noise(text: str) -> bool:
+    t_lower = text.lower()
+    return (
+        'base score' in t_lower or text == 'Save' or 'mb ·' in t_lower or 'read more…' in t_lower
+        or text.startswith('✅') or text.startswith('🚀') or 'english [' in t_lower or 'portuguese [' in t_lower
+    )
+
+
+def _build_books(cards: Iterable[Card], limit: Optional[int]) -> List[schemas.BookDetails]:
+    results = []
+    seen_md5s = set()
+
+    for md5, cover_url, texts in cards:
+        if limit is not None and len(results) >= limit:
+            break
+        if md5 in seen_md5s:
+            continue
+
+        # Filter out UI elements and metadata
+        valid_texts = [t for t in texts if not _is_noise(t)]
+        if not valid_texts:
+            continue
+
+        # If the first text is a raw filename or path, skip it
+        first_text = valid_texts[0].lower()
+        if 'upload/' in first_text or 'lgli/' in first_text or first_text.endswith(('.epub', '.pdf', '.mobi', '.azw3', '.lit', '.txt')):
+            valid_texts = valid_texts[1:]
+
+        if not valid_texts:
+            continue
+
+        title = valid_texts[0]
+        author = valid_texts[1][:100] if len(valid_texts) > 1 else "Unknown Author"
+
+        seen_md5s.add(md5)
+
+        summary_str = " | ".join(valid_texts[:4]) if valid_texts else "Disponível no Anna's Archive."
+        if len(summary_str) > 200:
+            summary_str = summary_str[:197] + "..."
+
+        detail_url = f"https://annas-archive.gl/md5/{md5}"
+
+        book = schemas.BookDetails(
+            id=f"aa_{md5}",
+            title=title,
+            author=author,
+            language="pt",
+            source="Annas Archive",
+            download_url=detail_url,
+            preview_url=detail_url,
+            cover_url=cover_url,
+            summary=summary_str,
+        )
+        results.append(book)
+
+    return results
@@ -1,10 +1,90 @@
+import json
 from abc import ABC, abstractmethod
-from typing import List
+from typing import Any, List, Optional
+
+import httpx
+
 import schemas
+from http_client import HttpClientRegistry
+from upstream import upstream_scheduler
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional, json is the fallback
+    orjson = None
+
+# Bodies past this are refused rather than buffered and parsed
+MAX_RESPONSE_BYTES = 4 * 1024 * 1024
+
+
+class ResponseTooLarge(Exception):
+    pass
+
+
+def loads(data: bytes) -> Any:
+    return orjson.loads(data) if orjson is not None else json.loads(data)
 
 
 class BookProvider(ABC):
+    # Short, stable identifier used in cache keys and status reports
+    name: str = ""
+    # Seconds an upstream request may take before httpx gives up on it
+    timeout: float = 10.0
+
+    def __init__(self, clients: Optional[HttpClientRegistry] = None) -> None:
+        self.clients = clients
+
+    def use_clients(self, clients: Optional[HttpClientRegistry]) -> None:
+        """Inject the shared client registry (None falls back to one-off clients)"""
+        self.clients = clients
+
+    async def get_body(self, url: str, max_bytes: int = MAX_RESPONSE_BYTES, **kwargs) -> bytes:
+        """GET `url` through the upstream scheduler (rate limits, concurrency
+        cap, Retry-After backoff) and the shared pooled client, or a throwaway
+        client if none was injected. The body is streamed so that no more than
+        `max_bytes` is ever buffered. Raises for HTTP errors and oversized bodies.
+        """
+        if self.clients is not None:
+            return await self._read_body(self.clients.get(url), url, max_bytes, kwargs)
+
+        async with httpx.AsyncClient() as client:
+            return await self._read_body(client, url, max_bytes, kwargs)
+
+    async def get_json(self, url: str, max_bytes: int = MAX_RESPONSE_BYTES, **kwargs) -> Any:
+        return loads(await self.get_body(url, max_bytes, **kwargs))
+
+    async def _read_body(self, client: httpx.AsyncClient, url: str, max_bytes: int, kwargs: dict) -> bytes:
+        follow_redirects = kwargs.pop("follow_redirects", False)
+        request = client.build_request("GET", url, **kwargs)
+
+        async def read(response: httpx.Response) -> bytes:
+            try:
+                response.raise_for_status()
+                length = response.headers.get("Content-Length")
+                if length and length.isdigit() and int(length) > max_bytes:
+                    raise ResponseTooLarge(f"{url} answered {length} bytes, over the {max_bytes} byte cap")
+                data = bytearray()
+                async for chunk in response.aiter_bytes():
+                    data.extend(chunk)
+                    if len(data) > max_bytes:
+                        raise ResponseTooLarge(f"{url} answered over the {max_bytes} byte cap")
+                return bytes(data)
+            finally:
+                await response.aclose()
+
+        # The body is read while the scheduler slot is held, so the
+        # concurrency caps cover the transfer and not just the headers
+        return await upstream_scheduler.request(
+            url, lambda: client.send(request, stream=True, follow_redirects=follow_redirects), read
+        )
+
     @abstractmethod
-    async def search(self, query: str, limit: int = 20) -> List[schemas.BookDetails]:
-        """Search books matching the query text in this provider"""
+    async def search(self, query: str, limit: int = 20, page: int = 1) -> List[schemas.BookDetails]:
+        """Search books matching the query text in this provider.
+
+        `page` is 1-based and in the provider's own page size where the
+        upstream API fixes one, in which case the whole page is returned
+        whatever `limit`; an empty list means there are no more pages.
+        Upstream failures propagate so the caller can track provider health.
+        """
         pass
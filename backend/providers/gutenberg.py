@@ -1,27 +1,31 @@
-import httpx
+import os
 from typing import List
 import schemas
 from .base import BookProvider
 
+# Overridable so benchmarks can point at a local stand-in
+GUTENDEX_URL = os.getenv("GUTENDEX_URL", "https://gutendex.com")
+
+# Gutendex has no field selection; a full page of 32 books is ~40 KB
+MAX_SEARCH_BYTES = 2 * 1024 * 1024
+
 
 class GutenbergProvider(BookProvider):
-    async def search(self, query: str, limit: int = 20) -> List[schemas.BookDetails]:
-        url = "https://gutendex.com/books/"
+    name = "gutenberg"
+
+    async def search(self, query: str, limit: int = 20, page: int = 1) -> List[schemas.BookDetails]:
+        url = f"{GUTENDEX_URL}/books/"
         # We search with specifically portuguese Language filter as requested
         params = {"search": query, "languages": "pt"}
+        # Gutendex pages are a fixed 32 books; all of them are returned, as
+        # cutting a page to `limit` would skip the rest when paging
+        if page > 1:
+            params["page"] = str(page)
 
-        async with httpx.AsyncClient() as client:
-            try:
-                # We use a 10 second timeout
-                response = await client.get(url, params=params, timeout=10.0)
-                response.raise_for_status()
-                data = response.json()
-            except Exception as e:
-                print(f"Gutenberg API error: {e}")
-                return []
+        data = await self.get_json(url, MAX_SEARCH_BYTES, params=params, timeout=self.timeout)
 
         results = []
-        for item in data.get("results", [])[:limit]:
+        for item in data.get("results", []):
             authors = [a["name"] for a in item.get("authors", [])]
             author_str = ", ".join(authors) if authors else "Unknown"
 
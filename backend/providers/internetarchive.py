@@ -1,32 +1,37 @@
-import httpx
+import os
 from typing import List
 import schemas
 from .base import BookProvider
 
+# Overridable so benchmarks can point at a local stand-in
+ARCHIVE_URL = os.getenv("ARCHIVE_URL", "https://archive.org")
+
+# Descriptions come back in full (we only keep 500 characters of each),
+# so a page can run large
+MAX_SEARCH_BYTES = 2 * 1024 * 1024
+
 class InternetArchiveProvider(BookProvider):
-    async def search(self, query: str, limit: int = 20) -> List[schemas.BookDetails]:
+    name = "internetarchive"
+    timeout = 15.0
+
+    async def search(self, query: str, limit: int = 20, page: int = 1) -> List[schemas.BookDetails]:
         # Internet Archive Advanced Search API
-        url = "https://archive.org/advancedsearch.php"
+        url = f"{ARCHIVE_URL}/advancedsearch.php"
         
         # Format exactly as IA expects
         fq = f"{query} AND mediatype:(texts) AND language:(por)"
         
         params = {
             "q": fq,
-            "fl[]": ["identifier", "title", "creator", "description", "downloads", "language"],
+            # Sorting on downloads doesn't need it returned
+            "fl[]": ["identifier", "title", "creator", "description"],
             "sort[]": "downloads desc",
             "rows": str(limit),
+            "page": str(page),
             "output": "json"
         }
 
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.get(url, params=params, timeout=15.0)
-                response.raise_for_status()
-                data = response.json()
-            except Exception as e:
-                print(f"InternetArchive API error: {e}")
-                return []
+        data = await self.get_json(url, MAX_SEARCH_BYTES, params=params, timeout=self.timeout)
 
         results = []
         docs = data.get("response", {}).get("docs", [])
@@ -1,25 +1,34 @@
-import httpx
+import os
 from typing import List
 import schemas
 from .base import BookProvider
 
+# Overridable so benchmarks can point at a local stand-in
+OPENLIBRARY_URL = os.getenv("OPENLIBRARY_URL", "https://openlibrary.org")
+
+SEARCH_FIELDS = "key,title,author_name,cover_i,publisher"
+MAX_SEARCH_BYTES = 2 * 1024 * 1024
+
 
 class OpenLibraryProvider(BookProvider):
-    async def search(self, query: str, limit: int = 20) -> List[schemas.BookDetails]:
+    name = "openlibrary"
+
+    async def search(self, query: str, limit: int = 20, page: int = 1) -> List[schemas.BookDetails]:
         # Open Library search API
         # We enforce language:por
         # To avoid borrowing queue ("embargos"), we might look for items with full text available that are public
-        url = "https://openlibrary.org/search.json"
-        params = {"q": query, "language": "por", "has_fulltext": "true", "limit": str(limit)}
+        url = f"{OPENLIBRARY_URL}/search.json"
+        params = {
+            "q": query,
+            "language": "por",
+            "has_fulltext": "true",
+            "limit": str(limit),
+            "page": str(page),
+            # Only what we read below; full docs carry every ISBN, edition and subject
+            "fields": SEARCH_FIELDS,
+        }
 
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.get(url, params=params, timeout=10.0)
-                response.raise_for_status()
-                data = response.json()
-            except Exception as e:
-                print(f"OpenLibrary API error: {e}")
-                return []
+        data = await self.get_json(url, MAX_SEARCH_BYTES, params=params, timeout=self.timeout)
 
         results = []
         for doc in data.get("docs", []):
@@ -0,0 +1,166 @@
+import re
+import unicodedata
+from typing import Dict, FrozenSet, List, Optional
+
+import schemas
+
+# Higher is better. Open Library serves large, real covers; Anna's Archive
+# thumbnails are small and often missing.
+COVER_QUALITY = {
+    "Open Library": 3,
+    "Project Gutenberg": 2,
+    "Internet Archive": 2,
+    "Annas Archive": 1,
+}
+# Gutenberg links straight to an EPUB, Internet Archive to a PDF; Anna's
+# Archive only to a detail page.
+DOWNLOAD_QUALITY = {
+    "Project Gutenberg": 3,
+    "Internet Archive": 2,
+    "Annas Archive": 1,
+}
+
+UNKNOWN_AUTHORS = {"unknown", "unknown author", "desconhecido"}
+NAME_PARTICLES = {"de", "da", "do", "das", "dos", "e", "y", "van", "von"}
+SUBTITLE_RE = re.compile(r"\s*(?::|;|\(|\[| - | — ).*$")
+NON_WORD_RE = re.compile(r"[^\w\s]", re.UNICODE)
+
+
+def normalize_text(value: Optional[str]) -> str:
+    """Lowercase, strip accents and punctuation, collapse whitespace"""
+    if not value:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", value)
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return " ".join(NON_WORD_RE.sub(" ", stripped.lower()).split())
+
+
+def title_key(title: Optional[str]) -> str:
+    main_title = SUBTITLE_RE.sub("", title or "") or (title or "")
+    return normalize_text(main_title)
+
+
+def author_tokens(author: Optional[str]) -> FrozenSet[str]:
+    # A token set matches both "Machado de Assis" and "Assis, Machado de"
+    normalized = normalize_text(author)
+    if not normalized or normalized in UNKNOWN_AUTHORS:
+        return frozenset()
+    return frozenset(t for t in normalized.split() if t not in NAME_PARTICLES and len(t) > 1)
+
+
+class Cluster:
+    def __init__(self, book: schemas.BookDetails, position: int) -> None:
+        self.books = [book]
+        self.authors = author_tokens(book.author)
+        # Position of the earliest member in its provider's own ranking
+        self.position = position
+
+    def matches(self, authors: FrozenSet[str]) -> bool:
+        # Unknown authors can't contradict a match
+        return not authors or not self.authors or bool(authors & self.authors)
+
+    def add(self, book: schemas.BookDetails, authors: FrozenSet[str], position: int) -> None:
+        self.books.append(book)
+        self.authors = self.authors | authors
+        self.position = min(self.position, position)
+
+    def merged(self) -> schemas.BookDetails:
+        """The best member, topped up with the best cover and links of the cluster"""
+        best = max(self.books, key=_completeness)
+        if len(self.books) == 1:
+            return best
+
+        with_cover = [b for b in self.books if b.cover_url]
+        with_download = [b for b in self.books if b.download_url]
+        with_preview = [b for b in self.books if b.preview_url]
+        update = {}
+        if with_cover:
+            update["cover_url"] = max(with_cover, key=lambda b: COVER_QUALITY.get(b.source, 0)).cover_url
+        if with_download:
+            update["download_url"] = max(with_download, key=lambda b: DOWNLOAD_QUALITY.get(b.source, 0)).download_url
+        if not best.preview_url and with_preview:
+            update["preview_url"] = with_preview[0].preview_url
+        if best.author is None or normalize_text(best.author) in UNKNOWN_AUTHORS:
+            known = [b.author for b in self.books if author_tokens(b.author)]
+            if known:
+                update["author"] = known[0]
+        return best.model_copy(update=update)
+
+    def sources(self) -> int:
+        return len({book.source for book in self.books})
+
+
+def _completeness(book: schemas.BookDetails) -> tuple:
+    return (
+        DOWNLOAD_QUALITY.get(book.source, 0) if book.download_url else 0,
+        1 if book.preview_url else 0,
+        COVER_QUALITY.get(book.source, 0) if book.cover_url else 0,
+    )
+
+
+def cluster_books(books_by_provider: List[List[schemas.BookDetails]]) -> List[Cluster]:
+    """Group duplicates across providers.
+
+    Books are bucketed by normalized main title, so each book is only
+    compared with the few clusters sharing its title.
+    """
+    buckets: Dict[str, List[Cluster]] = {}
+    clusters: List[Cluster] = []
+
+    for books in books_by_provider:
+        for position, book in enumerate(books):
+            # Untitled books can't be matched; keep them as their own cluster
+            key = title_key(book.title) or f"id:{book.id}"
+            authors = author_tokens(book.author)
+            bucket = buckets.setdefault(key, [])
+            for cluster in bucket:
+                if cluster.matches(authors):
+                    cluster.add(book, authors, position)
+                    break
+            else:
+                cluster = Cluster(book, position)
+                bucket.append(cluster)
+                clusters.append(cluster)
+
+    return clusters
+
+
+def score(cluster: Cluster, book: schemas.BookDetails, query_tokens: List[str], query_title: str) -> float:
+    relevance = 0.0
+    if query_tokens:
+        title_words = set(normalize_text(book.title).split())
+        author_words = set(normalize_text(book.author).split())
+        title_hits = sum(1 for t in query_tokens if t in title_words)
+        author_hits = sum(1 for t in query_tokens if t in author_words)
+        relevance = (3.0 * title_hits + 2.0 * author_hits) / len(query_tokens)
+        # Both sides keep their particles: query_tokens has none left
+        if query_title and title_key(book.title) == query_title:
+            relevance += 2.0
+
+    availability = (
+        (1.0 if book.download_url else 0.0)
+        + (0.5 if book.preview_url else 0.0)
+        + (0.3 if book.cover_url else 0.0)
+    )
+    agreement = 0.5 * (cluster.sources() - 1)
+    # Small tie-breaker that keeps each provider's own ordering
+    position = -0.02 * cluster.position
+
+    return relevance + availability + agreement + position
+
+
+def merge_and_rank(
+    query: str, books_by_provider: List[List[schemas.BookDetails]], limit: Optional[int] = None
+) -> List[schemas.BookDetails]:
+    """Deduplicate books across providers and return the `limit` best (all of them by default)"""
+    query_tokens = [t for t in normalize_text(query).split() if t not in NAME_PARTICLES]
+    query_title = title_key(query)
+
+    scored = []
+    for cluster in cluster_books(books_by_provider):
+        book = cluster.merged()
+        scored.append((score(cluster, book, query_tokens, query_title), book))
+
+    # sort() is stable, so equal scores keep provider order
+    scored.sort(key=lambda item: item[0], reverse=True)
+    return [book for _, book in scored[:limit]]
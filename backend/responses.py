@@ -0,0 +1,79 @@
+import json
+import re
+from typing import Any, Iterable, Mapping, Optional
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+import schemas
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional, json is the fallback
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - without msgpack every client gets JSON
+    msgpack = None
+
+MSGPACK_TYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+
+
+def dumps_json(payload: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def book_payload(book: schemas.BookDetails) -> Mapping[str, Any]:
+    # BookDetails only has plain fields, so its __dict__ is already the
+    # serialized form; no model_dump() or re-validation needed
+    return vars(book)
+
+
+def books_payload(books: Iterable[schemas.BookDetails]) -> list:
+    return [vars(book) for book in books]
+
+
+def wants_msgpack(accept: Optional[str]) -> bool:
+    if msgpack is None or not accept:
+        return False
+    for part in accept.split(","):
+        media_type, _, params = part.strip().partition(";")
+        if media_type.strip().lower() not in MSGPACK_TYPES:
+            continue
+        q = 1.0
+        match = re.search(r"q=([0-9.]+)", params)
+        if match:
+            try:
+                q = float(match.group(1))
+            except ValueError:
+                q = 0.0
+        return q > 0
+    return False
+
+
+class FastResponse(Response):
+    """JSON (orjson) or MessagePack, as the Accept header asks.
+
+    Takes content that is already plain data, such as `books_payload(...)`.
+    Routes return it directly, so FastAPI skips validating it against
+    the response_model again. The response_model is still declared for
+    the OpenAPI schema.
+    """
+
+    def __init__(
+        self,
+        content: Any,
+        request: Request,
+        status_code: int = 200,
+        headers: Optional[Mapping[str, str]] = None,
+    ) -> None:
+        headers = dict(headers or {})
+        headers["Vary"] = "Accept"
+        if wants_msgpack(request.headers.get("accept")):
+            body, media_type = msgpack.packb(content, use_bin_type=True), "application/msgpack"
+        else:
+            body, media_type = dumps_json(content), "application/json"
+        super().__init__(body, status_code, headers, media_type)
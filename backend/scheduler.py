@@ -0,0 +1,67 @@
+import asyncio
+import random
+from typing import Awaitable, Callable, List, Optional
+
+
+class Job:
+    def __init__(
+        self,
+        name: str,
+        interval: float,
+        fn: Callable[[], Awaitable[None]],
+        jitter: float,
+        initial_delay: float,
+    ) -> None:
+        self.name = name
+        self.interval = interval
+        self.fn = fn
+        self.jitter = jitter
+        self.initial_delay = initial_delay
+
+    def next_delay(self) -> float:
+        # Spread runs out so jobs (and workers) don't fire in lockstep
+        return self.interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+
+class Scheduler:
+    """Runs async jobs periodically on the event loop.
+
+    A job's next run is scheduled after the previous one finishes, so a
+    slow run never overlaps itself. Errors are logged and the job carries on.
+    """
+
+    def __init__(self) -> None:
+        self.jobs: List[Job] = []
+        self._tasks: List["asyncio.Task"] = []
+
+    def every(
+        self,
+        interval: float,
+        fn: Callable[[], Awaitable[None]],
+        name: Optional[str] = None,
+        jitter: float = 0.1,
+        initial_delay: Optional[float] = None,
+    ) -> None:
+        if initial_delay is None:
+            initial_delay = random.uniform(0, interval * jitter)
+        self.jobs.append(Job(name or fn.__name__, interval, fn, jitter, initial_delay))
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._run(job)) for job in self.jobs]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _run(self, job: Job) -> None:
+        await asyncio.sleep(job.initial_delay)
+        while True:
+            try:
+                await job.fn()
+            except Exception as e:
+                print(f"Scheduled job '{job.name}' failed: {e}")
+            await asyncio.sleep(job.next_delay())
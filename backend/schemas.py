@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Dict, Optional, List
 from datetime import datetime
 
 
@@ -22,6 +22,13 @@ class BookDetails(BookBase):
     pass
 
 
+def book_from_row(row) -> BookDetails:
+    """BookDetails from a books_cache row we wrote ourselves, without the
+    from_attributes validation pass
+    """
+    return BookDetails.model_construct(**{field: getattr(row, field) for field in BookDetails.model_fields})
+
+
 class BookCache(BookBase):
     created_at: datetime
 
@@ -41,3 +48,28 @@ class Category(CategoryBase):
 
 class CategoryList(BaseModel):
     categorias: List[Category]
+
+
+class ProviderHealth(BaseModel):
+    name: str
+    state: str
+    calls: int
+    failures: int
+    error_rate: float
+    avg_latency: Optional[float] = None
+    p95_latency: Optional[float] = None
+    consecutive_failures: int
+    retry_in: Optional[float] = None
+
+
+class UpstreamHealth(BaseModel):
+    active: int
+    active_background: int
+    waiting: int
+    # Seconds left on each host's 429/503 backoff
+    backoff: Dict[str, float]
+
+
+class ProviderHealthList(BaseModel):
+    providers: List[ProviderHealth]
+    upstream: UpstreamHealth
@@ -0,0 +1,149 @@
+import json
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Mapping, Optional
+
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+import models
+import schemas
+
+# How long each provider's results stay fresh. A cached query is only as
+# fresh as the most volatile provider that contributed to it.
+PROVIDER_TTLS = {
+    "gutenberg": timedelta(hours=24),
+    "openlibrary": timedelta(hours=6),
+    "internetarchive": timedelta(hours=6),
+    "annasarchive": timedelta(hours=1),
+}
+DEFAULT_TTL = timedelta(hours=1)
+
+# After going stale an entry is still served (and refreshed in the
+# background) for this long before it counts as a miss.
+STALE_WINDOW = timedelta(hours=24)
+
+# Results missing a provider (timeout or error) are retried much sooner
+PARTIAL_TTL = timedelta(minutes=2)
+
+LRU_MAX_ENTRIES = 512
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+def make_key(query: str, limit: int, provider_names: Iterable[str]) -> str:
+    return f"{normalize_query(query)}|{limit}|{','.join(sorted(provider_names))}"
+
+
+def ttl_for(provider_names: Iterable[str]) -> timedelta:
+    ttls = [PROVIDER_TTLS.get(name, DEFAULT_TTL) for name in provider_names]
+    return min(ttls) if ttls else DEFAULT_TTL
+
+
+class CacheEntry:
+    def __init__(
+        self,
+        books: List[schemas.BookDetails],
+        fresh_until: datetime,
+        stale_until: datetime,
+        statuses: Optional[Mapping[str, str]] = None,
+    ) -> None:
+        self.books = books
+        self.fresh_until = fresh_until
+        self.stale_until = stale_until
+        # How each provider's call went when the entry was fetched; empty
+        # for rows stored before statuses were recorded
+        self.statuses: Dict[str, str] = dict(statuses or {})
+
+    def is_fresh(self, now: Optional[datetime] = None) -> bool:
+        return (now or datetime.utcnow()) < self.fresh_until
+
+    def is_usable(self, now: Optional[datetime] = None) -> bool:
+        return (now or datetime.utcnow()) < self.stale_until
+
+
+class SearchCache:
+    """Two-tier query cache: an in-process LRU in front of the search_cache table."""
+
+    def __init__(self, max_entries: int = LRU_MAX_ENTRIES) -> None:
+        self.max_entries = max_entries
+        self._lru: "OrderedDict[str, CacheEntry]" = OrderedDict()
+
+    def peek(self, key: str) -> Optional[CacheEntry]:
+        """In-process tier only; cheap enough to call on the event loop"""
+        entry = self._lru.get(key)
+        if entry is None:
+            return None
+        if not entry.is_usable():
+            del self._lru[key]
+            return None
+        self._lru.move_to_end(key)
+        return entry
+
+    def remember(self, key: str, entry: CacheEntry) -> None:
+        """Put an entry found in another tier into the in-process one"""
+        self._remember(key, entry)
+
+    def load(self, db: Session, key: str) -> Optional[CacheEntry]:
+        """search_cache table tier. Runs on the DB executor, so it leaves the
+        in-process tier alone; promote hits with remember() on the event loop.
+        """
+        return self._load(db, key, datetime.utcnow())
+
+    def set(
+        self,
+        key: str,
+        statuses: Mapping[str, str],
+        books: List[schemas.BookDetails],
+        partial: bool = False,
+    ) -> CacheEntry:
+        """Update the in-process tier; persist the result with store()"""
+        ttl = PARTIAL_TTL if partial else ttl_for(statuses)
+        fresh_until = datetime.utcnow() + ttl
+        entry = CacheEntry(books, fresh_until, fresh_until + STALE_WINDOW, statuses)
+        self._remember(key, entry)
+        return entry
+
+    def store(
+        self,
+        db: Session,
+        key: str,
+        query: str,
+        entry: CacheEntry,
+    ) -> None:
+        # Upsert: one write-behind batch may carry the same key more than once
+        values = {
+            "query": normalize_query(query),
+            "providers": ",".join(sorted(entry.statuses)),
+            "book_ids": json.dumps([book.id for book in entry.books]),
+            "created_at": datetime.utcnow(),
+            "fresh_until": entry.fresh_until,
+            "stale_until": entry.stale_until,
+            "statuses": json.dumps(entry.statuses),
+        }
+        stmt = sqlite_insert(models.SearchCache).values(key=key, **values)
+        db.execute(stmt.on_conflict_do_update(index_elements=[models.SearchCache.key], set_=values))
+
+    def _remember(self, key: str, entry: CacheEntry) -> None:
+        self._lru[key] = entry
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    def _load(self, db: Session, key: str, now: datetime) -> Optional[CacheEntry]:
+        row = db.get(models.SearchCache, key)
+        if row is None or row.stale_until is None or now >= row.stale_until:
+            return None
+
+        book_ids = json.loads(row.book_ids or "[]")
+        rows = db.query(models.BookCache).filter(models.BookCache.id.in_(book_ids)).all()
+        by_id = {book.id: book for book in rows}
+        if len(by_id) < len(set(book_ids)):
+            # Some books were evicted from books_cache; treat as a miss.
+            return None
+
+        books = [schemas.book_from_row(by_id[book_id]) for book_id in book_ids]
+        statuses = json.loads(row.statuses) if row.statuses else None
+        return CacheEntry(books, row.fresh_until, row.stale_until, statuses)  # type: ignore[arg-type]
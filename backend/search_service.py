@@ -0,0 +1,503 @@
+import asyncio
+import os
+from collections import Counter, OrderedDict, deque
+from datetime import datetime, timedelta
+from functools import partial
+from typing import Deque, Dict, List, Mapping, Optional, Set, Tuple
+
+import metrics
+import models
+import schemas
+from cache_backends import CacheBackend, create_backend
+from crud import get_book, get_category_names, upsert_books
+from database import engine, run_db
+from fanout import ProviderResult, STATUS_CACHED, STATUS_OK, iter_provider_results
+from fulltext import init_fulltext, search_local
+from http_client import HttpClientRegistry
+from leader import FileLock, lock_path
+from pagination import Cursor
+from providers.base import loads
+from ranking import merge_and_rank
+from responses import book_payload, dumps_json
+from search_cache import CacheEntry, SearchCache, make_key, normalize_query
+from singleflight import SingleFlight
+from upstream import background
+from write_behind import WriteBehindQueue
+
+from providers.gutenberg import GutenbergProvider
+from providers.openlibrary import OpenLibraryProvider
+from providers.internetarchive import InternetArchiveProvider
+from providers.annasarchive import AnnasArchiveProvider
+
+# Shared by the API and the Telegram bot, which run on the same event loop
+providers = [AnnasArchiveProvider(), GutenbergProvider(), OpenLibraryProvider(), InternetArchiveProvider()]
+provider_names = [provider.name for provider in providers]
+
+search_cache = SearchCache()
+# Background refreshes in flight by key, kept referenced until they finish
+refreshing: Dict[str, "asyncio.Task"] = {}
+write_queue = WriteBehindQueue()
+# Cache misses for the same key share one fan-out; it runs to completion
+# even if its callers go away, since the result lands in the cache
+search_flights = SingleFlight()
+
+# Shared by every node (Redis) or every process on the host (SQLite file)
+# when set: search entries as "search:{key}" (book ids and expiry) and books
+# as "book:{id}", so a node serves what any node fetched. See cache_backends.
+CACHE_URL = os.getenv("CACHE_URL", "")
+shared_cache: Optional[CacheBackend] = create_backend(CACHE_URL) if CACHE_URL else None
+# Books outlive the search entries that reference them
+SHARED_BOOK_TTL_SECONDS = 7 * 24 * 3600
+# Shared-cache writes in flight, kept referenced until they finish
+shared_writes: Set["asyncio.Task"] = set()
+
+# Page size of /api/search; other callers use it too so they share cache entries
+DEFAULT_SEARCH_LIMIT = 60
+MAX_SEARCH_LIMIT = 100
+# Page size of /api/categoria/{nome}
+CATEGORY_LIMIT = 100
+
+# Per-request latency budget: providers still running when it expires are
+# cancelled and the request answers with whatever has arrived.
+DEFAULT_BUDGET_SECONDS = float(os.getenv("SEARCH_BUDGET_SECONDS", "12"))
+MAX_BUDGET_SECONDS = 30.0
+# Send a backup request to providers running past their p95 latency
+HEDGE_REQUESTS = os.getenv("SEARCH_HEDGE_REQUESTS", "1") == "1"
+
+# local_first answers from the local index when it finds at least
+# this many books (or `limit`, if smaller)
+LOCAL_MIN_RESULTS = 10
+
+# A page spanning the end of one round of provider pages pulls in at most
+# this many further rounds before answering short
+MAX_ROUNDS_PER_PAGE = 2
+
+# Cache warming: categories and the most searched recent queries are
+# re-fetched in the background before their cache entries go stale
+WARM_INTERVAL_SECONDS = float(os.getenv("WARM_INTERVAL_SECONDS", "600"))
+WARM_CONCURRENCY = int(os.getenv("WARM_CONCURRENCY", "2"))
+WARM_TOP_QUERIES = int(os.getenv("WARM_TOP_QUERIES", "20"))
+# Searches remembered for picking the top queries
+RECENT_QUERIES_WINDOW = 1000
+# Books of recent results kept by id until the write-behind queue lands
+# them in books_cache
+RECENT_BOOKS_MAX = 5000
+
+
+class RecentQueries:
+    """Counts of the last `window` first-page searches, by (normalized query, limit)"""
+
+    def __init__(self, window: int = RECENT_QUERIES_WINDOW) -> None:
+        self._recent: Deque[Tuple[str, int]] = deque()
+        self._counts: Counter = Counter()
+        self.window = window
+
+    def record(self, query: str, limit: int) -> None:
+        item = (normalize_query(query), limit)
+        if not item[0]:
+            return
+        self._recent.append(item)
+        self._counts[item] += 1
+        if len(self._recent) > self.window:
+            old = self._recent.popleft()
+            self._counts[old] -= 1
+            if not self._counts[old]:
+                del self._counts[old]
+
+    def top(self, n: int) -> List[Tuple[str, int]]:
+        return [item for item, _ in self._counts.most_common(n)]
+
+
+recent_queries = RecentQueries()
+
+
+class RecentBooks:
+    """Books of the latest results, so their details and covers resolve
+    before the write-behind queue has stored them. Event loop only.
+    """
+
+    def __init__(self, max_entries: int = RECENT_BOOKS_MAX) -> None:
+        self.max_entries = max_entries
+        self._books: "OrderedDict[str, schemas.BookDetails]" = OrderedDict()
+
+    def add(self, books: List[schemas.BookDetails]) -> None:
+        for book in books:
+            self._books[book.id] = book
+            self._books.move_to_end(book.id)
+        while len(self._books) > self.max_entries:
+            self._books.popitem(last=False)
+
+    def get(self, book_id: str) -> Optional[schemas.BookDetails]:
+        return self._books.get(book_id)
+
+
+recent_books = RecentBooks()
+
+
+def add_missing_columns() -> None:
+    # create_all doesn't alter tables that already exist
+    with engine.begin() as conn:
+        columns = {row[1] for row in conn.exec_driver_sql("PRAGMA table_info(search_cache)")}
+        if "statuses" not in columns:
+            conn.exec_driver_sql("ALTER TABLE search_cache ADD COLUMN statuses TEXT")
+
+
+def init_schema() -> None:
+    # Processes starting together would race to create the same tables
+    with FileLock(lock_path("schema")):
+        models.Base.metadata.create_all(bind=engine)
+        add_missing_columns()
+        init_fulltext(engine)
+
+
+async def start_services() -> HttpClientRegistry:
+    """Setup shared by every process that searches (API workers, the standalone bot)"""
+    await asyncio.to_thread(init_schema)
+    http_clients = HttpClientRegistry()
+    for provider in providers:
+        provider.use_clients(http_clients)
+    write_queue.start()
+    return http_clients
+
+
+async def stop_services(http_clients: HttpClientRegistry) -> None:
+    # Refreshes still running would use the clients closed below
+    refreshes = list(refreshing.values())
+    for task in refreshes:
+        task.cancel()
+    await asyncio.gather(*refreshes, return_exceptions=True)
+    await write_queue.stop()
+    if shared_cache is not None:
+        if shared_writes:
+            await asyncio.gather(*shared_writes, return_exceptions=True)
+        await shared_cache.aclose()
+    for provider in providers:
+        provider.use_clients(None)
+    await http_clients.aclose()
+
+
+def category_query(nome: str) -> str:
+    return f"subject:{nome}" if "openlibrary" in [p.__class__.__name__.lower() for p in providers] else nome
+
+
+def combine_results(query: str, results: List[ProviderResult]) -> List[schemas.BookDetails]:
+    """Merge a round of provider results, keeping all of them for later pages"""
+    # Feed the merge in provider order regardless of which one answered first
+    by_provider = {result.provider: result.books for result in results}
+    return merge_and_rank(query, [by_provider.get(name, []) for name in provider_names])
+
+
+def resolve_budget(budget: Optional[float]) -> float:
+    return min(budget or DEFAULT_BUDGET_SECONDS, MAX_BUDGET_SECONDS)
+
+
+def round_providers(pages: Optional[Mapping[str, int]]) -> List[str]:
+    if pages is None:
+        return provider_names
+    return [name for name in provider_names if name in pages]
+
+
+def page_key(query: str, limit: int, pages: Optional[Mapping[str, int]] = None) -> str:
+    """Cache key for one round of provider pages; the first round shares the plain search key"""
+    key = make_key(query, limit, round_providers(pages))
+    if pages and any(page != 1 for page in pages.values()):
+        key += "|" + ",".join(f"{name}:{pages[name]}" for name in sorted(pages))
+    return key
+
+
+async def fetch_from_providers(
+    query: str,
+    limit: int,
+    budget: Optional[float] = None,
+    pages: Optional[Mapping[str, int]] = None,
+) -> Tuple[List[schemas.BookDetails], Dict[str, str]]:
+    selected = [provider for provider in providers if provider.name in round_providers(pages)]
+    results = [
+        result
+        async for result in iter_provider_results(
+            selected, query, limit, timeout=resolve_budget(budget), hedge=HEDGE_REQUESTS, pages=pages,
+            failure_after=DEFAULT_BUDGET_SECONDS,
+        )
+    ]
+    statuses = {result.provider: result.status for result in results}
+    return combine_results(query, results), statuses
+
+
+def remember_results(key: str, query: str, books: List[schemas.BookDetails], statuses: Dict[str, str]) -> None:
+    entry = search_cache.set(key, statuses, books, is_partial(statuses))
+    recent_books.add(books)
+    # Books must land before the cache row that references them
+    write_queue.submit(upsert_books, books)
+    write_queue.submit(search_cache.store, key, query, entry)
+    if shared_cache is not None:
+        task = asyncio.create_task(store_shared(key, entry))
+        shared_writes.add(task)
+        task.add_done_callback(shared_writes.discard)
+
+
+async def store_shared(key: str, entry: CacheEntry) -> None:
+    search_ttl = (entry.stale_until - datetime.utcnow()).total_seconds()
+    search = dumps_json({
+        "ids": [book.id for book in entry.books],
+        "fresh_until": entry.fresh_until.isoformat(),
+        "stale_until": entry.stale_until.isoformat(),
+        "statuses": entry.statuses,
+    })
+    try:
+        # Books first, like the SQLite tier: an entry never points at missing books
+        await shared_cache.set_many(
+            {f"book:{book.id}": dumps_json(book_payload(book)) for book in entry.books}, SHARED_BOOK_TTL_SECONDS
+        )
+        await shared_cache.set_many({f"search:{key}": search}, search_ttl)
+    except Exception as e:
+        metrics.shared_cache_errors.labels("write").inc()
+        print(f"Shared cache write error for '{key}': {e}")
+
+
+async def load_shared(key: str) -> Optional[CacheEntry]:
+    try:
+        raw = await shared_cache.get(f"search:{key}")
+        if raw is None:
+            return None
+        search = loads(raw)
+        ids = search["ids"]
+        found = await shared_cache.get_many([f"book:{book_id}" for book_id in ids])
+    except Exception as e:
+        metrics.shared_cache_errors.labels("read").inc()
+        print(f"Shared cache read error for '{key}': {e}")
+        return None
+    if len(found) < len(set(ids)):
+        return None  # some books expired; treat as a miss
+    books = [schemas.BookDetails.model_construct(**loads(found[f"book:{book_id}"])) for book_id in ids]
+    entry = CacheEntry(
+        books,
+        datetime.fromisoformat(search["fresh_until"]),
+        datetime.fromisoformat(search["stale_until"]),
+        search.get("statuses"),
+    )
+    return entry if entry.is_usable() else None
+
+
+async def find_book(book_id: str) -> Optional[schemas.BookDetails]:
+    """A book any node has seen: this node's latest results, the shared cache,
+    then this node's books_cache
+    """
+    book = recent_books.get(book_id)
+    if book is not None:
+        return book
+    if shared_cache is not None:
+        try:
+            raw = await shared_cache.get(f"book:{book_id}")
+        except Exception as e:
+            metrics.shared_cache_errors.labels("read").inc()
+            print(f"Shared cache read error for book '{book_id}': {e}")
+            raw = None
+        if raw is not None:
+            return schemas.BookDetails.model_construct(**loads(raw))
+    return await run_db(get_book, book_id)
+
+
+def is_partial(statuses: Dict[str, str]) -> bool:
+    return any(status != STATUS_OK for status in statuses.values())
+
+
+def cached_statuses(entry: CacheEntry, names: List[str]) -> Dict[str, str]:
+    """Statuses for an answer served from the cache: `cached` for providers
+    that answered when it was fetched, what went wrong for the others
+    """
+    statuses = {}
+    for name in names:
+        status = entry.statuses.get(name, STATUS_OK)
+        statuses[name] = STATUS_CACHED if status == STATUS_OK else status
+    return statuses
+
+
+async def refresh_search(
+    key: str, query: str, limit: int, pages: Optional[Mapping[str, int]] = None
+) -> List[schemas.BookDetails]:
+    # Someone already has an answer, stale or not: yield to interactive searches
+    with background():
+        books, statuses = await fetch_from_providers(query, limit, pages=pages)
+    # Don't let a failed fan-out overwrite a good cached answer
+    if books:
+        remember_results(key, query, books, statuses)
+    return books
+
+
+def schedule_refresh(key: str, query: str, limit: int, pages: Optional[Mapping[str, int]] = None) -> None:
+    if key in refreshing:
+        return
+    task = refreshing[key] = asyncio.create_task(refresh_search(key, query, limit, pages))
+    task.add_done_callback(lambda t: _refresh_done(key, t))
+
+
+def _refresh_done(key: str, task: "asyncio.Task") -> None:
+    refreshing.pop(key, None)
+    if not task.cancelled() and task.exception() is not None:
+        print(f"Background refresh error for '{key}': {task.exception()}")
+
+
+async def lookup_cache(key: str) -> Optional[CacheEntry]:
+    entry = search_cache.peek(key)
+    tier = "memory"
+    if entry is None and shared_cache is not None:
+        entry = await load_shared(key)
+        tier = "shared"
+        if entry is not None:
+            search_cache.remember(key, entry)
+    if entry is None:
+        entry = await run_db(search_cache.load, key)
+        tier = "db"
+        if entry is not None:
+            search_cache.remember(key, entry)
+    if entry is None:
+        metrics.search_cache_requests.labels("miss").inc()
+    else:
+        metrics.search_cache_requests.labels(tier if entry.is_fresh() else "stale").inc()
+    return entry
+
+
+async def cached_search(
+    query: str,
+    limit: int,
+    budget: Optional[float] = None,
+    local_first: bool = False,
+) -> Tuple[List[schemas.BookDetails], Dict[str, str]]:
+    """The first `limit` results of a search"""
+    recent_queries.record(query, limit)
+    books, statuses = await cached_round(query, limit, budget, local_first)
+    return books[:limit], statuses
+
+
+async def cached_round(
+    query: str,
+    limit: int,
+    budget: Optional[float] = None,
+    local_first: bool = False,
+    pages: Optional[Mapping[str, int]] = None,
+) -> Tuple[List[schemas.BookDetails], Dict[str, str]]:
+    """All merged results of one round of provider pages, `limit` asked of each provider"""
+    key = page_key(query, limit, pages)
+
+    entry = await lookup_cache(key)
+    if entry is not None:
+        # Entries stored before provider statuses were recorded can't tell
+        # a failed provider from one that answered; replace them too
+        if not entry.is_fresh() or not entry.statuses:
+            # Serve the stale answer now, refresh it for the next caller
+            schedule_refresh(key, query, limit, pages)
+        return entry.books, cached_statuses(entry, round_providers(pages))
+
+    if local_first:
+        local_books = await run_db(search_local, query, limit)
+        if len(local_books) >= min(limit, LOCAL_MIN_RESULTS):
+            return local_books, {"local": STATUS_OK}
+
+    # Concurrent callers share the first caller's fan-out, and its budget
+    return await search_flights.do(key, partial(fetch_and_remember, key, query, limit, budget, pages))
+
+
+async def fetch_and_remember(
+    key: str,
+    query: str,
+    limit: int,
+    budget: Optional[float] = None,
+    pages: Optional[Mapping[str, int]] = None,
+) -> Tuple[List[schemas.BookDetails], Dict[str, str]]:
+    books, statuses = await fetch_from_providers(query, limit, budget, pages)
+    if books:
+        remember_results(key, query, books, statuses)
+    return books, statuses
+
+
+async def search_page(
+    query: str,
+    limit: int,
+    cursor: Optional[Cursor] = None,
+    budget: Optional[float] = None,
+    local_first: bool = False,
+) -> Tuple[List[schemas.BookDetails], Dict[str, str], Optional[Cursor]]:
+    """One page of results and the cursor for the next (None at the end).
+
+    Each round asks every provider for its next page; the merged, cached
+    result of a round is sliced into pages of `limit`, and a page running
+    past the end of a round continues into the next one.
+    """
+    if cursor is None:
+        recent_queries.record(query, limit)
+    cursor = cursor or Cursor.start(provider_names, limit)
+    books: List[schemas.BookDetails] = []
+    statuses: Dict[str, str] = {}
+
+    for _ in range(MAX_ROUNDS_PER_PAGE + 1):
+        round_books, round_statuses = await cached_round(
+            query, limit, budget, local_first and cursor.is_start(), cursor.pages
+        )
+        if "local" in round_statuses:
+            # Answered from the local index, which isn't paginated
+            return round_books[:limit], round_statuses, None
+        statuses.update(round_statuses)
+
+        taken = round_books[cursor.offset:cursor.offset + limit - len(books)]
+        books.extend(taken)
+        cursor = cursor.advanced(len(taken))
+        if len(books) >= limit and cursor.offset < len(round_books):
+            return books, statuses, cursor
+        if not round_books:
+            # Every provider is out of pages (or failed on this one)
+            return books, statuses, None
+
+        # A cached round reports the statuses it was fetched with, so a
+        # provider that failed then is asked for the same page again too
+        answered = [name for name, status in round_statuses.items() if status in (STATUS_OK, STATUS_CACHED)]
+        if len(round_books) < limit and len(answered) == len(round_statuses):
+            # Every provider came back with less than a page: they are out
+            # of results, and asking for another round would only cost a
+            # round trip to each of them
+            return books, statuses, None
+        cursor = cursor.next_round(answered)
+        if len(books) >= limit:
+            break
+
+    return books, statuses, cursor
+
+
+async def warm_search(query: str, limit: int) -> bool:
+    """Re-fetch a search unless its cache entry stays fresh past the next warming pass"""
+    key = page_key(query, limit)
+    entry = await lookup_cache(key)
+    margin = timedelta(seconds=WARM_INTERVAL_SECONDS * 1.5)
+    if entry is not None and entry.fresh_until - datetime.utcnow() > margin:
+        return False
+    # Joins a user's cache-miss fan-out for the same key, if one is running
+    await search_flights.do(key, partial(fetch_and_remember, key, query, limit))
+    return True
+
+
+async def warm_searches(searches: List[Tuple[str, int]]) -> None:
+    semaphore = asyncio.Semaphore(WARM_CONCURRENCY)
+
+    async def warm(query: str, limit: int) -> bool:
+        async with semaphore:
+            try:
+                return await warm_search(query, limit)
+            except Exception as e:
+                print(f"Cache warming error for '{query}': {e}")
+                return False
+
+    # Same normalized search from two sources is warmed once
+    searches = list(dict.fromkeys(searches))
+    # The warming tasks, and fan-outs they start, inherit the background lane
+    with background():
+        refreshed = await asyncio.gather(*(warm(query, limit) for query, limit in searches))
+    if any(refreshed):
+        print(f"Cache warming: refreshed {sum(refreshed)} of {len(searches)} searches")
+
+
+async def warm_categories() -> None:
+    names = await run_db(get_category_names)
+    await warm_searches([(normalize_query(category_query(nome)), CATEGORY_LIMIT) for nome in names])
+
+
+async def warm_popular_queries() -> None:
+    await warm_searches(recent_queries.top(WARM_TOP_QUERIES))
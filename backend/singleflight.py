@@ -0,0 +1,76 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+from upstream import Lane, join_lane, priority, shared_lane
+
+
+class _Call:
+    def __init__(self, task: "asyncio.Task", lane: Lane) -> None:
+        self.task = task
+        self.lane = lane
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Concurrent calls with the same key share one execution of the work.
+
+    The work runs in its own task, so a caller giving up (timeout, client
+    disconnect) only detaches that caller. With `cancel_abandoned`, the work
+    is cancelled once every caller has given up; otherwise it runs to
+    completion, which suits work whose result is cached as a side effect.
+
+    The work's upstream requests run in the highest-priority lane of the
+    callers waiting on it, so a user joining a background refresh doesn't
+    wait in the background lane.
+    """
+
+    def __init__(self, cancel_abandoned: bool = False) -> None:
+        self.cancel_abandoned = cancel_abandoned
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._calls
+
+    def join(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Awaitable[Any], bool]:
+        """Return an awaitable for the shared result and whether this caller started the work.
+
+        Joining is synchronous, so callers checking `key in flight` first
+        see a consistent answer. The awaitable must be awaited.
+        """
+        call = self._calls.get(key)
+        leader = call is None
+        if call is None:
+            lane = shared_lane()
+            call = _Call(asyncio.ensure_future(self._run(lane, fn)), lane)
+            self._calls[key] = call
+            call.task.add_done_callback(lambda task: self._finished(key, call))
+        else:
+            join_lane(call.lane)
+        call.waiters += 1
+        return self._wait(call), leader
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        waiter, _ = self.join(key, fn)
+        return await waiter
+
+    @staticmethod
+    async def _run(lane: Lane, fn: Callable[[], Awaitable[Any]]) -> Any:
+        # The task runs in a copy of the caller's context; its own lane can
+        # be promoted without touching the caller's
+        priority.set(lane)
+        return await fn()
+
+    async def _wait(self, call: _Call) -> Any:
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and self.cancel_abandoned and not call.task.done():
+                call.task.cancel()
+
+    def _finished(self, key: Hashable, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        # Nobody may be left to see the error; retrieve it to keep asyncio quiet
+        if not call.task.cancelled():
+            call.task.exception()
@@ -0,0 +1,315 @@
+import asyncio
+import contextvars
+import itertools
+import os
+import time
+from contextlib import asynccontextmanager, contextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+import metrics
+
+# Priority lanes: user-facing searches go ahead of background refreshes
+INTERACTIVE = 0
+BACKGROUND = 1
+LANE_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+
+class Lane:
+    """The lane of a piece of work. Work shared between callers (SingleFlight)
+    runs in the highest-priority lane of any of them, including callers that
+    are themselves shared work promoted later on.
+    """
+
+    def __init__(self, value: int) -> None:
+        self._value = value
+        self._callers: List["Lane"] = []
+
+    @property
+    def value(self) -> int:
+        return min([self._value, *(caller.value for caller in self._callers)])
+
+    def share(self, caller: "Lane") -> None:
+        self._callers.append(caller)
+
+
+# Lane of whatever runs in the current context (tasks inherit it)
+priority: contextvars.ContextVar[Lane] = contextvars.ContextVar("upstream_priority", default=Lane(INTERACTIVE))
+
+# Requests per second and burst size per upstream host
+HOST_RATES: Dict[str, Tuple[float, int]] = {
+    "gutendex.com": (5.0, 10),
+    "openlibrary.org": (5.0, 10),
+    "covers.openlibrary.org": (10.0, 20),
+    "archive.org": (3.0, 6),
+    "annas-archive.li": (1.0, 3),
+}
+DEFAULT_HOST_RATE = (10.0, 20)
+
+
+def _parse_host_rates(value: str) -> Dict[str, Tuple[float, int]]:
+    """Parse UPSTREAM_HOST_RATES: comma-separated host=rate/burst"""
+    rates = {}
+    for part in filter(None, (part.strip() for part in value.split(","))):
+        host, _, limit = part.partition("=")
+        rate, _, burst = limit.partition("/")
+        rates[host] = (float(rate), int(burst or max(1, int(float(rate)))))
+    return rates
+
+
+HOST_RATES.update(_parse_host_rates(os.getenv("UPSTREAM_HOST_RATES", "")))
+
+# Upstream requests in flight at once, across every host...
+MAX_CONCURRENT = int(os.getenv("UPSTREAM_MAX_CONCURRENT", "16"))
+# ...of which background work may hold at most this share
+BACKGROUND_SHARE = 0.5
+
+# Backoff after a 429/503 that didn't say how long to wait: doubles per
+# consecutive rejection up to the maximum
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 120.0
+# A rejected request is retried once if the host asks for at most this wait
+MAX_RETRY_WAIT_SECONDS = 2.0
+# Interactive requests fail fast rather than wait out a longer backoff
+MAX_INTERACTIVE_WAIT_SECONDS = 2.0
+
+THROTTLE_STATUSES = (429, 503)
+
+
+class UpstreamBackoff(Exception):
+    """The host told us to back off for longer than the caller can wait"""
+
+    def __init__(self, host: str, seconds: float) -> None:
+        super().__init__(f"{host} is backing off for {seconds:.1f}s")
+        self.host = host
+        self.seconds = seconds
+
+
+@contextmanager
+def background() -> Iterator[None]:
+    """Run the upstream calls made inside (and in tasks started inside) in the background lane"""
+    token = priority.set(Lane(BACKGROUND))
+    try:
+        yield
+    finally:
+        priority.reset(token)
+
+
+def shared_lane() -> Lane:
+    """A lane for work shared between callers, starting with the current one"""
+    lane = Lane(BACKGROUND)
+    lane.share(priority.get())
+    return lane
+
+
+def join_lane(lane: Lane) -> None:
+    """Add the current caller to shared work's lane. If that promotes it,
+    requests the work already has waiting for a slot move up with it.
+    """
+    before = lane.value
+    lane.share(priority.get())
+    if lane.value < before:
+        upstream_scheduler._wake_waiters()
+
+
+def host_of(url: str) -> str:
+    return urlsplit(url).hostname or url
+
+
+def retry_after_seconds(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header: delta seconds or an HTTP date"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+class HostLimiter:
+    """Token bucket and Retry-After backoff for one upstream host.
+
+    Interactive requests reserve their token, waiting in line if the bucket
+    is empty; background requests only take a token that is there now, so
+    they never push interactive ones back.
+    """
+
+    def __init__(self, host: str, rate: float, burst: int) -> None:
+        self.host = host
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.backoff_until = 0.0
+        self.rejections = 0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def backoff_remaining(self, now: Optional[float] = None) -> float:
+        return max(0.0, self.backoff_until - (now or time.monotonic()))
+
+    async def take(self, lane: Lane) -> None:
+        # lane.value is re-read on every pass: shared work may be promoted meanwhile
+        while True:
+            now = time.monotonic()
+            backoff = self.backoff_remaining(now)
+            if backoff:
+                if lane.value == INTERACTIVE and backoff > MAX_INTERACTIVE_WAIT_SECONDS:
+                    raise UpstreamBackoff(self.host, backoff)
+                await asyncio.sleep(backoff)
+                continue
+
+            self._refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            if lane.value == INTERACTIVE:
+                # Reserve a token from the future and wait for it to accrue
+                self.tokens -= 1
+                await asyncio.sleep(-self.tokens / self.rate)
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def observe(self, status_code: int, retry_after: Optional[float]) -> Optional[float]:
+        """Record a response; returns the backoff it started, if any"""
+        if status_code not in THROTTLE_STATUSES:
+            self.rejections = 0
+            return None
+        self.rejections += 1
+        if retry_after is None:
+            if status_code != 429:
+                return None  # a plain 503 is an outage, not a rate limit
+            retry_after = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (self.rejections - 1))
+        self.backoff_until = max(self.backoff_until, time.monotonic() + retry_after)
+        metrics.upstream_backoffs.labels(self.host).inc()
+        print(f"Upstream {self.host} answered {status_code}; backing off for {retry_after:.1f}s")
+        return retry_after
+
+
+class UpstreamScheduler:
+    """Gate for every upstream HTTP request: per-host rate limits, a global
+    concurrency cap with priority lanes, and Retry-After backoff.
+    """
+
+    def __init__(self, max_concurrent: int = MAX_CONCURRENT, background_share: float = BACKGROUND_SHARE) -> None:
+        self.max_concurrent = max_concurrent
+        self.max_background = max(1, int(max_concurrent * background_share))
+        self.active = 0
+        self.active_background = 0
+        self.hosts: Dict[str, HostLimiter] = {}
+        # (arrival, lane, future) of requests waiting for a slot; ordered
+        # when waking, as a waiter's lane can be promoted while it waits
+        self._waiters: List[Tuple[int, Lane, "asyncio.Future"]] = []
+        self._arrivals = itertools.count()
+
+    def limiter(self, host: str) -> HostLimiter:
+        limiter = self.hosts.get(host)
+        if limiter is None:
+            rate, burst = HOST_RATES.get(host, DEFAULT_HOST_RATE)
+            limiter = self.hosts[host] = HostLimiter(host, rate, burst)
+        return limiter
+
+    def _can_start(self, lane: int) -> bool:
+        if self.active >= self.max_concurrent:
+            return False
+        return lane == INTERACTIVE or self.active_background < self.max_background
+
+    def _start(self, lane: int) -> None:
+        self.active += 1
+        if lane == BACKGROUND:
+            self.active_background += 1
+
+    async def _acquire(self, lane: Lane) -> int:
+        """Wait for a slot; returns the lane it was admitted in"""
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append((next(self._arrivals), lane, future))
+        self._wake_waiters()
+        try:
+            return await future  # _wake_waiters counts us in before resolving it
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._release(future.result())
+            raise
+
+    def _release(self, lane: int) -> None:
+        self.active -= 1
+        if lane == BACKGROUND:
+            self.active_background -= 1
+        self._wake_waiters()
+
+    def _wake_waiters(self) -> None:
+        waiting = []
+        for arrival, lane, future in sorted(self._waiters, key=lambda waiter: (waiter[1].value, waiter[0])):
+            if future.done():
+                continue  # cancelled while waiting
+            admitted = lane.value
+            if self._can_start(admitted):
+                self._start(admitted)
+                future.set_result(admitted)
+            else:
+                waiting.append((arrival, lane, future))
+        self._waiters = waiting
+
+    @asynccontextmanager
+    async def slot(self, url: str) -> AsyncIterator[HostLimiter]:
+        """Hold one upstream request slot for `url`'s host; report the response
+        status to the yielded limiter with `observe`.
+        """
+        lane = priority.get()
+        limiter = self.limiter(host_of(url))
+        started = time.perf_counter()
+        await limiter.take(lane)
+        admitted = await self._acquire(lane)
+        metrics.upstream_wait_duration.labels(limiter.host, LANE_NAMES[admitted]).observe(time.perf_counter() - started)
+        try:
+            yield limiter
+        finally:
+            self._release(admitted)
+
+    async def request(
+        self,
+        url: str,
+        send: Callable[[], Awaitable[httpx.Response]],
+        read: Optional[Callable[[httpx.Response], Awaitable[Any]]] = None,
+    ) -> Any:
+        """Send a request through the scheduler, retrying once after a short Retry-After.
+
+        With `read`, returns `read(response)`, run while the slot is still
+        held so that streamed bodies count against the caps until consumed.
+        """
+        for attempt in range(2):
+            async with self.slot(url) as limiter:
+                response = await send()
+                wait = limiter.observe(response.status_code, retry_after_seconds(response.headers.get("Retry-After")))
+                if wait is None or wait > MAX_RETRY_WAIT_SECONDS or attempt:
+                    return await read(response) if read is not None else response
+            await response.aclose()
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        return {
+            "active": self.active,
+            "active_background": self.active_background,
+            "waiting": sum(1 for _, _, future in self._waiters if not future.done()),
+            "backoff": {
+                host: round(limiter.backoff_remaining(now), 1)
+                for host, limiter in self.hosts.items()
+                if limiter.backoff_remaining(now)
+            },
+        }
+
+
+upstream_scheduler = UpstreamScheduler()
+metrics.upstream_active.set_function(lambda: upstream_scheduler.active)
@@ -0,0 +1,72 @@
+import asyncio
+from typing import Any, Callable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+import metrics
+from database import run_db
+
+# A job is a function taking a Session as its first argument, plus its other args
+Job = Tuple[Callable[..., Any], tuple]
+
+MAX_BATCH_JOBS = 64
+
+
+class WriteBehindQueue:
+    """Applies DB writes in order on a background worker, off the request path.
+
+    Jobs queued while a batch is running are drained together and committed
+    in one transaction on the DB executor.
+    """
+
+    def __init__(self, max_batch_jobs: int = MAX_BATCH_JOBS) -> None:
+        self.max_batch_jobs = max_batch_jobs
+        self._queue: Optional["asyncio.Queue[Job]"] = None
+        self._worker: Optional["asyncio.Task"] = None
+
+    def start(self) -> None:
+        if self._worker is not None and not self._worker.done():
+            return
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._run())
+
+    def submit(self, fn: Callable[..., Any], *args: Any) -> None:
+        # Started lazily so writes still land when no lifespan ran (scripts, tests)
+        self.start()
+        assert self._queue is not None
+        self._queue.put_nowait((fn, args))
+
+    async def flush(self) -> None:
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def stop(self) -> None:
+        await self.flush()
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    async def _run(self) -> None:
+        assert self._queue is not None
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.max_batch_jobs and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            try:
+                with metrics.write_behind_batch_duration.time():
+                    await run_db(_apply, batch)
+            except Exception as e:
+                print(f"Write-behind error ({len(batch)} jobs dropped): {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+
+def _apply(db: Session, batch: List[Job]) -> None:
+    for fn, args in batch:
+        fn(db, *args)
@@ -12,6 +12,25 @@ export interface Book {
     summary: string | null;
 }
 
+const apiUrl = process.env.NODE_ENV === "production"
+    ? "https://openlibrary-api-t91i.onrender.com"
+    : "http://localhost:8000";
+
+// Covers go through the API's cover proxy (cached and resized) instead of hot-linking the source
+export function coverSrc(book: Book, size: "card" | "detail" = "card"): string {
+    return `${apiUrl}/api/covers/${encodeURIComponent(book.id)}?size=${size}`;
+}
+
+// If the proxy can't serve a cover, fall back to the source image once
+export function coverFallback(book: Book) {
+    return (event: React.SyntheticEvent<HTMLImageElement>) => {
+        const img = event.currentTarget;
+        if (book.cover_url && img.src !== book.cover_url) {
+            img.src = book.cover_url;
+        }
+    };
+}
+
 export default function BookCard({ book }: { book: Book }) {
     const [isHovered, setIsHovered] = useState(false);
     const [isFavorite, setIsFavorite] = useState(false);
@@ -70,7 +89,8 @@ export default function BookCard({ book }: { book: Book }) {
                 <div className={`relative w-full aspect-[2/3] mb-4 rounded-xl overflow-hidden shadow-md border border-gray-200 dark:border-white/10 transition-transform duration-500 ${isHovered ? 'scale-105 shadow-red-600/30' : ''} bg-slate-100 dark:bg-slate-800 flex items-center justify-center group-hover:shadow-2xl`}>
                     {book.cover_url ? (
                         <img
-                            src={book.cover_url}
+                            src={coverSrc(book)}
+                            onError={coverFallback(book)}
                             alt={book.title}
                             className="w-full h-full object-cover transition-transform duration-700 ease-in-out group-hover:scale-110"
                             loading="lazy"
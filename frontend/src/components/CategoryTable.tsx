@@ -1,7 +1,7 @@
 "use client";
 
 import { useState } from "react";
-import { Book } from "./BookCard";
+import { Book, coverFallback, coverSrc } from "./BookCard";
 import { ChevronLeft, ChevronRight, BookOpen, ExternalLink, Download } from "lucide-react";
 
 interface CategoryTableProps {
@@ -84,7 +84,7 @@ export default function CategoryTable({ books, categoryName }: CategoryTableProp
                                         <div className="flex items-center gap-4">
                                             <div className="w-12 h-16 bg-gray-200 dark:bg-gray-800 rounded shadow-sm overflow-hidden flex-shrink-0 flex items-center justify-center">
                                                 {book.cover_url ? (
-                                                    <img src={book.cover_url} alt={book.title} className="w-full h-full object-cover" />
+                                                    <img src={coverSrc(book)} onError={coverFallback(book)} alt={book.title} className="w-full h-full object-cover" />
                                                 ) : (
                                                     <BookOpen className="w-5 h-5 text-gray-400" />
                                                 )}
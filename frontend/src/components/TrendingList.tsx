@@ -1,7 +1,7 @@
 "use client";
 
 import { useEffect, useState, useRef } from "react";
-import { Book } from "./BookCard";
+import { Book, coverFallback, coverSrc } from "./BookCard";
 import { BookOpen, ExternalLink, Download, Heart, ChevronLeft, ChevronRight, TrendingUp } from "lucide-react";
 import Link from "next/link";
 
@@ -106,7 +106,8 @@ export default function TrendingList() {
                         <div className="relative aspect-[2/3] w-full rounded-2xl overflow-hidden shadow-md group-hover/card:shadow-2xl transition-shadow bg-gray-100 dark:bg-gray-800 mb-3">
                             {book.cover_url ? (
                                 <img
-                                    src={book.cover_url}
+                                    src={coverSrc(book)}
+                                    onError={coverFallback(book)}
                                     alt={book.title}
                                     className="w-full h-full object-cover transition-transform duration-700 group-hover/card:scale-105"
                                     loading="lazy"